@@ -0,0 +1,57 @@
+"""Measure how long it takes a fresh interpreter to import s4sdk modules,
+and check that the core ones don't drag in heavy dependencies.
+
+Usage: python -m benchmarks.import_time [REPEAT]
+
+Exits with status 1 if a module imports something it shouldn't, so it
+can be run as a regression check.
+"""
+import json
+import subprocess
+import sys
+import time
+
+# Module, and the heavy dependencies importing it must not load
+MODULES = [
+    ("s4sdk", ("numpy", "pandas", "yaml", "pyarrow")),
+    ("s4sdk.package", ("numpy", "pandas", "yaml", "pyarrow")),
+    ("s4sdk.tools", ("numpy", "pandas", "yaml", "pyarrow")),
+    ("s4sdk.resource.stbl", ("pandas", "yaml", "pyarrow")),
+    ("s4sdk.localization", ("pandas", "yaml", "pyarrow")),
+]
+
+PROBE = """
+import json, sys
+import {module}
+print(json.dumps(sorted(m for m in {forbidden!r} if m in sys.modules)))
+"""
+
+
+def run(code):
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", code], check=True,
+                         capture_output=True, text=True).stdout
+    return time.perf_counter() - start, out
+
+
+def best_of(code, repeat):
+    return min(run(code)[0] for _ in range(repeat))
+
+
+def main(repeat=10):
+    baseline = best_of("pass", repeat)
+    print("interpreter startup: %7.1f ms" % (baseline * 1000,))
+    failed = False
+    for module, forbidden in MODULES:
+        elapsed = best_of("import " + module, repeat) - baseline
+        _, out = run(PROBE.format(module=module, forbidden=forbidden))
+        loaded = json.loads(out)
+        print("%-22s %7.1f ms%s" % (module, elapsed * 1000,
+                                    "  loads " + ", ".join(loaded)
+                                    if loaded else ""))
+        failed = failed or bool(loaded)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*map(int, sys.argv[1:])))
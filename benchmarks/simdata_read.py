@@ -0,0 +1,157 @@
+"""Benchmark SimDataReader on a synthetic tuning-like SimData resource:
+many small tables of objects that refer to each other. Times decoding
+everything, and reading a single top-level value.
+
+Usage: python -m benchmarks.simdata_read [NUM_TABLES [ROWS_PER_TABLE]]
+"""
+import random
+import struct
+import sys
+import time
+import tracemalloc
+
+from s4sdk import fnv, utils
+from s4sdk.resource.simdata import DataType, SimDataReader
+
+# Entry: value INT32, next OBJECT, children VECTOR, key RESOURCEKEY
+ENTRY_COLUMNS = (("value", DataType.INT32, 0), ("next", DataType.OBJECT, 4),
+                 ("children", DataType.VECTOR, 8),
+                 ("key", DataType.RESOURCEKEY, 16))
+ENTRY_SIZE = 32
+NULL = -0x80000000
+
+
+def _hash(name):
+    return fnv.fnv1(name.lower().encode("utf-8"), 32)
+
+
+def make_simdata(num_tables, rows_per_table, seed=0):
+    """num_tables tables of Entry objects, each linking to rows of random
+    other tables, plus a named root table"""
+    rnd = random.Random(seed)
+    schema_pos = 24 + 28 * (num_tables + 1)
+    column_pos = schema_pos + 24
+    data_pos = (column_pos + 20 * len(ENTRY_COLUMNS) + 15) & ~15
+    table_size = ENTRY_SIZE * rows_per_table
+    root_pos = data_pos + table_size * num_tables
+    names_pos = root_pos + ENTRY_SIZE
+    names = bytearray()
+    buf = bytearray(names_pos)
+
+    def name(at, string):
+        struct.pack_into("<iI", buf, at, names_pos + len(names) - at,
+                         _hash(string))
+        names.extend(string.encode("utf-8") + b"\0")
+
+    def off32(at, target):
+        struct.pack_into("<i", buf, at, target - at)
+
+    def row_pos(table, row):
+        return data_pos + table * table_size + row * ENTRY_SIZE
+
+    def entry(at, value):
+        table = rnd.randrange(num_tables)
+        off32(at + 4, row_pos(table, rnd.randrange(rows_per_table)))
+        table = rnd.randrange(num_tables)
+        off32(at + 8, row_pos(table, 0))
+        struct.pack_into("<i", buf, at, value)
+        struct.pack_into("<IQII", buf, at + 12, min(2, rows_per_table),
+                         rnd.getrandbits(64), 0x545AC67A, 0)
+
+    buf[0:4] = b"DATA"
+    struct.pack_into("<I", buf, 4, 0x101)
+    off32(8, 24)
+    struct.pack_into("<i", buf, 12, num_tables + 1)
+    off32(16, schema_pos)
+    struct.pack_into("<i", buf, 20, 1)
+
+    name(schema_pos, "Entry")
+    struct.pack_into("<II", buf, schema_pos + 8, 0, ENTRY_SIZE)
+    off32(schema_pos + 16, column_pos)
+    struct.pack_into("<I", buf, schema_pos + 20, len(ENTRY_COLUMNS))
+    for i, (column, data_type, offset) in enumerate(ENTRY_COLUMNS):
+        at = column_pos + 20 * i
+        name(at, column)
+        struct.pack_into("<HHIi", buf, at + 8, data_type, 0, offset, NULL)
+
+    for table in range(num_tables + 1):
+        at = 24 + 28 * table
+        if table < num_tables:
+            struct.pack_into("<iI", buf, at, NULL, _hash(""))
+            pos, count = row_pos(table, 0), rows_per_table
+        else:
+            name(at, "root")
+            pos, count = root_pos, 1
+        off32(at + 8, schema_pos)
+        struct.pack_into("<II", buf, at + 12, 0, ENTRY_SIZE)
+        off32(at + 20, pos)
+        struct.pack_into("<I", buf, at + 24, count)
+        for row in range(count):
+            entry(pos + row * ENTRY_SIZE, row)
+    return bytes(buf + names)
+
+
+class LinearReader(SimDataReader):
+    """Resolves references by scanning every table, as the legacy reader
+    did"""
+
+    def resolve_ref(self, pos, count):
+        for i, thdr in enumerate(self.table_data):
+            if thdr.row_pos <= pos < thdr.row_pos + thdr.row_size * thdr.row_count:
+                row_idx = (pos - thdr.row_pos) // thdr.row_size
+                if thdr.row_count < row_idx + count:
+                    raise utils.FormatException("Object runs off end of table")
+                if row_idx * thdr.row_size + thdr.row_pos != pos:
+                    raise utils.FormatException("Unaligned read of an object")
+                return (i, slice(row_idx, row_idx + count))
+        raise utils.FormatException("Object not in a table")
+
+
+def walk(reader):
+    """Decode every row and follow every reference"""
+    for table in reader.tables:
+        for row in table:
+            row["next"], row["children"]
+
+
+def read_root(bstr):
+    return SimDataReader(bstr).content["root"]["value"]
+
+
+def timeit(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(fn, *args):
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main(num_tables=2000, rows_per_table=20):
+    bstr = make_simdata(num_tables, rows_per_table)
+    print("%d tables of %d rows, %.1f MiB" % (num_tables, rows_per_table,
+                                              len(bstr) / 2 ** 20))
+    baseline = timeit(lambda: walk(LinearReader(bstr)), repeat=1)
+    indexed = timeit(lambda: walk(SimDataReader(bstr)))
+    print("full walk, linear resolve_ref: %7.3f s" % (baseline,))
+    print("full walk, bisect resolve_ref: %7.3f s  (%.1fx)"
+          % (indexed, baseline / indexed))
+    root = timeit(read_root, bstr)
+    print("read one root value:           %7.3f s" % (root,))
+    print("peak memory, full walk:        %7.1f MiB"
+          % (peak_memory(lambda: walk(SimDataReader(bstr))) / 2 ** 20,))
+    print("peak memory, one root value:   %7.1f MiB"
+          % (peak_memory(read_root, bstr) / 2 ** 20,))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
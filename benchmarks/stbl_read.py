@@ -0,0 +1,65 @@
+"""Benchmark StringTable.read_bytes on a synthetic string table.
+
+Usage: python -m benchmarks.stbl_read [NUM_ENTRIES]
+"""
+import random
+import struct
+import sys
+import time
+
+import pandas as pd
+
+from s4sdk import utils
+from s4sdk.resource.stbl import StringTable, StringTableMetadata
+
+WORDS = ("Sim", "plumbob", "{0.SimFirstName}", "Ünïcødé", "日本語",
+         "woohoo", "", "Llama")
+
+
+def make_stbl(num_entries, seed=0):
+    rnd = random.Random(seed)
+    body = bytearray()
+    str_length = 0
+    for _ in range(num_entries):
+        val = " ".join(rnd.choice(WORDS)
+                       for _ in range(rnd.randint(0, 8))).encode("utf-8")
+        body += struct.pack("<IBH", rnd.getrandbits(32), 0, len(val)) + val
+        str_length += len(val) + 1
+    header = b"STBL" + struct.pack("<HbQ2xI", 5, 0, num_entries, str_length)
+    return header + bytes(body)
+
+
+def read_per_row(bstr):
+    """The per-record BinPacker loop that read_bytes used to be"""
+    b_pack = utils.BinPacker(bstr)
+    meta_data = StringTableMetadata.from_binary_pack(b_pack=b_pack)
+    content = {"key_hash": {}, "flags": {}, "length": {}, "val": {}}
+    for row in range(meta_data.num_entries):
+        content["key_hash"][row] = b_pack.get_uint32()
+        content["flags"][row] = b_pack.get_uint8()
+        length = content["length"][row] = b_pack.get_uint16()
+        content["val"][row] = b_pack.get_raw_bytes(length).decode("utf-8")
+    return pd.DataFrame.from_dict(content)
+
+
+def timeit(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(num_entries=500_000):
+    bstr = make_stbl(num_entries)
+    print("%d entries, %.1f MiB" % (num_entries, len(bstr) / 2 ** 20))
+    baseline = timeit(read_per_row, bstr, repeat=1)
+    columnar = timeit(StringTable.read_bytes, bstr)
+    print("per-row loop:     %7.3f s" % (baseline,))
+    print("read_bytes:       %7.3f s  (%.1fx)" % (columnar,
+                                                 baseline / columnar))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
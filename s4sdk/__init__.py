@@ -1,2 +1,24 @@
-from s4sdk.resource.stbl import StringTable
-from s4sdk.package import Package
+import importlib
+
+# The top-level names are imported on first use, so that importing s4sdk
+# (as every submodule import does) doesn't load NumPy up front
+_LAZY = {
+    "Package": "s4sdk.package",
+    "StringTable": "s4sdk.resource.stbl",
+}
+
+__all__ = list(_LAZY)
+
+
+def __getattr__(name):
+    try:
+        module = _LAZY[name]
+    except KeyError:
+        raise AttributeError("module %r has no attribute %r"
+                             % (__name__, name)) from None
+    value = globals()[name] = getattr(importlib.import_module(module), name)
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -0,0 +1,5 @@
+from s4sdk.tools import main
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# Persistent indexes over the contents of packages
+
+import abc
+import os.path
+import sqlite3
+
+from s4sdk.package import open_package
+from s4sdk.package.metapackage import MetaPackage
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    signature TEXT
+);
+"""
+
+
+class PackageCatalog(metaclass=abc.ABCMeta):
+    """Base class for indexes of the contents of any number of packages,
+    stored in an SQLite database so that they persist between runs.
+
+    Packages are indexed under a name, normally their path. Re-indexing
+    a package replaces just its own entries, and is skipped if the
+    package hasn't changed since it was last indexed (see
+    AbstractPackage.signature).
+
+    Subclasses give the tables they add in SCHEMA, and implement _add,
+    which indexes a package's content under its id in the packages
+    table, and _delete, which forgets it again."""
+
+    SCHEMA = ""
+
+    def __init__(self, path=":memory:"):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA + self.SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def packages(self):
+        return [name for name, in
+                self.db.execute("SELECT name FROM packages ORDER BY name")]
+
+    def update(self, source, name=None, force=False, **options):
+        """Index source: a path, or an AbstractPackage (named by name, or
+        else its own name attribute). Returns False if the package was
+        already indexed and unchanged. options are passed on to _add.
+
+        A MetaPackage has each of its packages indexed separately; the
+        result is then the number of packages that were (re)indexed."""
+        if isinstance(source, MetaPackage):
+            return sum(self.update(package, force=force, **options)
+                       for package in source._package_list)
+        if isinstance(source, str):
+            name = name or os.path.abspath(source)
+            package = open_package(source, mode="r")
+        else:
+            name = name or getattr(source, "name", None)
+            if name is None:
+                raise ValueError("A name is required to index this package")
+            package = source
+        try:
+            # Asked of the package rather than the path: a sharded
+            # DirPackage changes without its root directory changing
+            signature = package.signature()
+            row = self.db.execute("SELECT id, signature FROM packages "
+                                  "WHERE name = ?", (name,)).fetchone()
+            if (row is not None and not force and signature is not None
+                    and row[1] == signature):
+                return False
+            with self.db:
+                if row is None:
+                    package_id = self.db.execute(
+                        "INSERT INTO packages (name, signature) "
+                        "VALUES (?, ?)", (name, signature)).lastrowid
+                else:
+                    package_id = row[0]
+                    self.db.execute("UPDATE packages SET signature = ? "
+                                    "WHERE id = ?", (signature, package_id))
+                    self._delete(package_id)
+                self._add(package_id, package, **options)
+        finally:
+            if package is not source:
+                package.close()
+        return True
+
+    def remove(self, name):
+        with self.db:
+            row = self.db.execute("SELECT id FROM packages WHERE name = ?",
+                                  (name,)).fetchone()
+            if row is None:
+                raise KeyError(name)
+            self._delete(row[0])
+            self.db.execute("DELETE FROM packages WHERE id = ?", row)
+
+    @abc.abstractmethod
+    def _add(self, package_id, package):
+        pass
+
+    @abc.abstractmethod
+    def _delete(self, package_id):
+        pass
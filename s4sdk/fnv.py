@@ -0,0 +1,176 @@
+# An implementation of 32- and 64-bit FNV-1 and FNV-1a
+#
+# Copyright (c) 2014, TQ Hirsch <thequux@thequux.com>
+#
+# Permission to use, copy, modify, and/or distribute this software for
+# any purpose with or without fee is hereby granted, provided that the
+# above copyright notice and this permission notice appear in all
+# copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL
+# WARRANTIES WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE
+# AUTHOR BE LIABLE FOR ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL
+# DAMAGES OR ANY DAMAGES WHATSOEVER RESULTING FROM LOSS OF USE, DATA
+# OR PROFITS, WHETHER IN AN ACTION OF CONTRACT, NEGLIGENCE OR OTHER
+# TORTIOUS ACTION, ARISING OUT OF OR IN CONNECTION WITH THE USE OR
+# PERFORMANCE OF THIS SOFTWARE.
+
+# Note that this file is NOT licensed under the default GPL used in
+# this project
+
+__all__ = (
+    'fnv1',
+    'fnv1a',
+    'fnv1_many',
+    'fnv1a_many',
+    'name_hash',
+)
+
+import functools
+from collections import namedtuple
+
+FnvParams = namedtuple('FnvParams', 'init prime mask')
+
+_fnv_params = {
+    32: FnvParams(0x811c9dc5,
+                  0x1000193,
+                  (1 << 32) - 1),
+    64: FnvParams(0xCBF29CE484222325,
+                  0x100000001b3,
+                  (1 << 64) - 1),
+}
+
+# How many distinct (string, size) pairs to remember the hashes of. The
+# same names come up over and over (column and schema names, above all)
+_CACHE_SIZE = 1 << 16
+
+def _fnv1(bstr, params):
+    init, prime, mask = params
+    h = init
+    for byte in bstr:
+        h = (h * prime) & mask
+        h = h ^ byte
+    return h
+
+def _fnv1a(bstr, params):
+    init, prime, mask = params
+    h = init
+    for byte in bstr:
+        h = h ^ byte
+        h = (h * prime) & mask
+    return h
+
+@functools.lru_cache(maxsize=_CACHE_SIZE)
+def _fnv1_cached(bstr, bits):
+    return _fnv1(bstr, _fnv_params[bits])
+
+@functools.lru_cache(maxsize=_CACHE_SIZE)
+def _fnv1a_cached(bstr, bits):
+    return _fnv1a(bstr, _fnv_params[bits])
+
+def fnv1(bstr, bits):
+    """Return the bits-bit hash of bstr.
+
+    32 and 64-bit hashes are supported. Hashes of bytes objects are
+    memoized.
+    """
+    if type(bstr) is bytes:
+        return _fnv1_cached(bstr, bits)
+    return _fnv1(bstr, _fnv_params[bits])
+
+def fnv1a(bstr, bits):
+    """Return the bits-bit FNV-1a hash of bstr; see fnv1"""
+    if type(bstr) is bytes:
+        return _fnv1a_cached(bstr, bits)
+    return _fnv1a(bstr, _fnv_params[bits])
+
+def name_hash(name, bits=32):
+    """Hash a name the way the game does: FNV-1 of its lowercased UTF-8"""
+    return fnv1(name.lower().encode('utf-8'), bits)
+
+# The batched functions hash as many strings at a time as fit in this
+# many bytes, padded to the longest of them
+_BATCH_BYTES = 1 << 22
+
+def _concat(strings, lower):
+    """Encode strings into one array of bytes; returns it with the
+    start and length of each string"""
+    import numpy as np
+    strings = list(strings)
+    # Encoding them all in one go is much quicker, and works as long as
+    # they're all str and the separator doesn't turn up in them
+    try:
+        text = '\0'.join(strings)
+    except TypeError:
+        text = None
+    if strings and text is not None:
+        if lower:
+            text = text.lower()
+        flat = np.frombuffer(text.encode('utf-8'), dtype=np.uint8)
+        ends = np.flatnonzero(flat == 0)
+        if len(ends) == len(strings) - 1:
+            ends = np.append(ends, len(flat))
+            starts = np.concatenate(([0], ends[:-1] + 1))
+            return flat, starts, ends - starts
+    encoded = [(s.lower() if lower else s) for s in strings]
+    encoded = [s.encode('utf-8') if isinstance(s, str) else bytes(s)
+               for s in encoded]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64,
+                          count=len(encoded))
+    starts = np.cumsum(lengths) - lengths
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), starts, lengths
+
+def _many(strings, bits, lower, alternate):
+    import numpy as np
+    init, prime, _ = _fnv_params[bits]
+    dtype = np.uint32 if bits == 32 else np.uint64
+    prime = dtype(prime)
+    flat, starts, lengths = _concat(strings, lower)
+    # Longest first, so that the strings still being hashed at each
+    # byte position are always a prefix of a batch, and strings of
+    # similar length are batched together
+    order = np.argsort(-lengths, kind='stable')
+    result = np.empty(len(lengths), dtype=dtype)
+    first = 0
+    while first < len(lengths):
+        width = int(lengths[order[first]])
+        batch = order[first:first + max(1, _BATCH_BYTES // max(width, 1))]
+        first += len(batch)
+        batch_lengths = lengths[batch]
+        # Byte position by string, padded with zeros, so that each
+        # position is a contiguous row
+        table = np.zeros((width, len(batch)), dtype=np.uint8)
+        mask = np.arange(width)[:, None] < batch_lengths
+        offsets = np.cumsum(batch_lengths) - batch_lengths
+        table.T[mask.T] = flat[np.repeat(starts[batch] - offsets,
+                                         batch_lengths)
+                               + np.arange(batch_lengths.sum())]
+        # How many strings are longer than each position
+        active = mask.sum(axis=1).tolist()
+        hashes = np.full(len(batch), init, dtype=dtype)
+        for row, count in zip(table, active):
+            h = hashes[:count]
+            if alternate:
+                h ^= row[:count]
+                h *= prime
+            else:
+                h *= prime
+                h ^= row[:count]
+        result[batch] = hashes
+    return result
+
+def fnv1_many(strings, bits=32, lower=False):
+    """Hash many strings (str, taken as UTF-8, or bytes) at once,
+    lowercasing them first if lower is true. Returns a NumPy array of
+    the hashes, in the same order.
+
+    The strings are hashed side by side, a byte position at a time, so
+    the cost in Python is per byte of the longest string rather than
+    per byte of all of them.
+    """
+    return _many(strings, bits, lower, False)
+
+def fnv1a_many(strings, bits=32, lower=False):
+    """FNV-1a version of fnv1_many"""
+    return _many(strings, bits, lower, True)
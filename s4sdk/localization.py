@@ -0,0 +1,206 @@
+# Tools for working with the string tables of whole packages at once
+
+import collections
+import csv
+import io
+import os
+import re
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from s4sdk import metadata, utils
+from s4sdk.resource import ResourceFilter
+from s4sdk.resource.stbl import StringTable, iter_stbl
+
+STRINGS_COLUMNS = ("instance", "key_hash", "flags", "val")
+
+
+def stbl_ids(package, locale=None):
+    """List the IDs of the string tables in package (an AbstractPackage),
+    optionally only those of one locale (a Locale or its code)"""
+    if isinstance(locale, metadata.Locale):
+        locale = locale.value
+    return [rid for rid in package.scan_index(
+                ResourceFilter(type=metadata.ResourceType.STBL.value))
+            if locale is None or metadata.locale_code(rid.instance) == locale]
+
+
+def _format_table(package, rid, delimiter):
+    out = io.StringIO()
+    writer = csv.writer(out, delimiter=delimiter, lineterminator="\n")
+    writer.writerows((rid.instance, key_hash, flags, val)
+                     for key_hash, flags, val
+                     in iter_stbl(package[rid].content))
+    return out.getvalue()
+
+
+def write_strings(package, path, delimiter=",", locale=None, workers=None):
+    """Write every entry of every string table in package to a CSV file
+    (or TSV, with delimiter="\\t"), one row per entry with the columns in
+    STRINGS_COLUMNS.
+
+    Tables are decompressed and formatted by a pool of worker threads
+    and written out in index order as they finish. Only a few tables
+    are held in memory at any time, however large the package is.
+    Returns the number of tables written.
+    """
+    rids = stbl_ids(package, locale)
+    if workers is None:
+        workers = min(32, (os.cpu_count() or 1) + 4)
+    with ThreadPoolExecutor(max_workers=workers) as pool, \
+            open(path, "w", encoding="utf-8-sig", newline="") as f:
+        csv.writer(f, delimiter=delimiter,
+                   lineterminator="\n").writerow(STRINGS_COLUMNS)
+        pending = collections.deque()
+        window = 2 * workers
+        for rid in rids:
+            if len(pending) >= window:
+                f.write(pending.popleft().result())
+            pending.append(pool.submit(_format_table, package, rid,
+                                       delimiter))
+        while pending:
+            f.write(pending.popleft().result())
+    return len(rids)
+
+
+_LOCALE_FILENAME = re.compile(r"Strings_([A-Z]{3}_[A-Z]{2})", re.IGNORECASE)
+
+
+def _open(source):
+    if isinstance(source, str):
+        from s4sdk.package import open_package
+        return open_package(source, mode="r")
+    return source
+
+
+def _guess_locale(source, package):
+    """Work out the locale of a Strings_<LOCALE>.package, from its name
+    or, failing that, from its string tables' instance IDs"""
+    if isinstance(source, str):
+        m = _LOCALE_FILENAME.search(os.path.basename(source))
+        if m and m.group(1).upper() in metadata.Locale.__members__:
+            return metadata.Locale[m.group(1).upper()]
+    codes = collections.Counter(metadata.locale_code(rid.instance)
+                                for rid in stbl_ids(package))
+    if not codes:
+        raise ValueError("Can't determine the locale of %r" % (source,))
+    return metadata.classify_locale(codes.most_common(1)[0][0] << 56)
+
+
+def _load_locale(locale, source):
+    """Read every string table of one locale into key and value arrays,
+    with later tables overriding earlier ones"""
+    package = _open(source)
+    try:
+        if locale is None:
+            locale = _guess_locale(source, package)
+        elif not isinstance(locale, metadata.Locale):
+            locale = metadata.Locale[locale]
+        tables = [StringTable.read_bytes(package[rid].content).columns
+                  for rid in stbl_ids(package, locale)]
+    finally:
+        if package is not source:
+            package.close()
+    keys = np.concatenate([np.zeros(0, dtype=np.uint32)]
+                          + [table["key_hash"] for table in tables])
+    vals = np.empty(len(keys), dtype=object)
+    vals[:] = [val for table in tables for val in table["val"]]
+    # Keep the last occurrence of each key, in table order
+    _, first_reversed = np.unique(keys[::-1], return_index=True)
+    keep = np.sort(len(keys) - 1 - first_reversed)
+    return locale, keys[keep], vals[keep]
+
+
+class TranslationMatrix:
+    """The strings of several locales side by side: one row per key hash
+    (keys, sorted) and one column per locale. Cells are indices into a
+    pool of strings shared by all locales, with -1 for a key a locale
+    doesn't define, so each distinct string is stored only once and
+    queries are array operations over the code matrix."""
+
+    def __init__(self, keys, locales, codes, strings):
+        self.keys = keys
+        self.locales = list(locales)
+        self.codes = codes
+        self.strings = strings
+
+    @classmethod
+    def load(cls, sources, workers=None):
+        """Load the string tables of several locales. sources is either an
+        iterable of packages (paths or AbstractPackages), whose locales
+        are taken from Strings_<LOCALE> in their filenames or from the
+        string tables' instance IDs, or a mapping from Locale (or locale
+        name) to package. Packages are read in parallel."""
+        if isinstance(sources, Mapping):
+            jobs = list(sources.items())
+        else:
+            jobs = [(None, source) for source in sources]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            loaded = list(pool.map(lambda job: _load_locale(*job), jobs))
+        return cls.from_columns(loaded)
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Build a matrix from (locale, key_hashes, values) triples"""
+        locales = [locale for locale, _, _ in columns]
+        if len(set(locales)) != len(locales):
+            raise ValueError("Locale loaded more than once")
+        keys = np.unique(np.concatenate(
+            [np.zeros(0, dtype=np.uint32)]
+            + [key_hash for _, key_hash, _ in columns])).astype(np.uint32)
+        all_values = np.concatenate(
+            [np.zeros(0, dtype=object)] + [vals for _, _, vals in columns])
+        strings, value_codes = np.unique(all_values, return_inverse=True)
+        codes = np.full((len(keys), len(columns)), -1, dtype=np.int32)
+        start = 0
+        for col, (_, key_hash, _) in enumerate(columns):
+            rows = np.searchsorted(keys, key_hash)
+            codes[rows, col] = value_codes[start:start + len(key_hash)]
+            start += len(key_hash)
+        return cls(keys, locales, codes, list(strings))
+
+    def _column(self, locale):
+        if not isinstance(locale, metadata.Locale):
+            locale = metadata.Locale[locale]
+        return self.codes[:, self.locales.index(locale)]
+
+    def get(self, key_hash, locale, default=None):
+        row = np.searchsorted(self.keys, key_hash)
+        if row == len(self.keys) or self.keys[row] != key_hash:
+            return default
+        code = self._column(locale)[row]
+        return default if code == -1 else self.strings[code]
+
+    def missing(self, locale, reference=None):
+        """Key hashes that locale lacks but reference (or, by default, any
+        other locale) defines"""
+        absent = self._column(locale) == -1
+        if reference is not None:
+            absent &= self._column(reference) != -1
+        else:
+            absent &= (self.codes != -1).any(axis=1)
+        return self.keys[absent]
+
+    def untranslated(self, locale, reference=metadata.Locale.ENG_US):
+        """Key hashes whose string in locale is the same as in reference,
+        i.e. that were most likely never translated. Empty strings
+        don't count."""
+        column, ref = self._column(locale), self._column(reference)
+        empty = self.strings.index("") if "" in self.strings else -2
+        return self.keys[(column == ref) & (column != -1) & (column != empty)]
+
+    def coverage(self) -> dict:
+        """Number of keys each locale defines"""
+        return {locale: int(count) for locale, count in
+                zip(self.locales, (self.codes != -1).sum(axis=0))}
+
+    def to_pandas(self) -> "pd.DataFrame":
+        """Materialize the matrix as a DataFrame indexed by key hash, with
+        one column per locale name and None for missing strings"""
+        pd = utils.require("pandas", "pandas")
+        pool = np.array(self.strings + [None], dtype=object)
+        return pd.DataFrame(pool[self.codes],
+                            index=pd.Index(self.keys, name="key_hash"),
+                            columns=[locale.name for locale in self.locales])
@@ -14,3 +14,40 @@ def classify_type(type: int):
         if ResourceType[type_str].value == type:
             return ResourceType[type_str]
     raise ValueError(f"Resource type '{type}' is unsupported")
+
+
+class Locale(Enum):
+    """The game's languages. A string table's locale is stored in the top
+    byte of its instance ID."""
+    ENG_US: int = 0x00
+    CHS_CN: int = 0x01
+    CHT_CN: int = 0x02
+    CZE_CZ: int = 0x03
+    DAN_DK: int = 0x04
+    DUT_NL: int = 0x05
+    FIN_FI: int = 0x06
+    FRE_FR: int = 0x07
+    GER_DE: int = 0x08
+    ITA_IT: int = 0x0B
+    JPN_JP: int = 0x0C
+    KOR_KR: int = 0x0D
+    NOR_NO: int = 0x0E
+    POL_PL: int = 0x0F
+    POR_BR: int = 0x11
+    RUS_RU: int = 0x12
+    SPA_ES: int = 0x13
+    SPA_MX: int = 0x15
+    SWE_SE: int = 0x16
+
+
+def locale_code(instance: int) -> int:
+    """Return the locale byte of a string table's instance ID"""
+    return instance >> 56
+
+
+def classify_locale(instance: int):
+    code = locale_code(instance)
+    for locale in Locale:
+        if locale.value == code:
+            return locale
+    raise ValueError(f"Locale '{code:#04x}' is unsupported")
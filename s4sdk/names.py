@@ -0,0 +1,157 @@
+# Resolving hashes (instance IDs, string table keys) back to the names
+# they were made from
+
+import os
+import struct
+
+import numpy as np
+
+from s4sdk import fnv, metadata, utils
+from s4sdk.resource import ResourceFilter
+
+_MAGIC = b"S4NAMES\x01"
+# Magic, number of names, size of the names blob
+_HEADER = struct.Struct("<8sQQ")
+
+
+def _layout(count, blob_size):
+    """Offsets of each array in an index file of count names"""
+    sections = [("offsets", np.uint64, count + 1),
+                ("hash64", np.uint64, count), ("order64", np.uint32, count),
+                ("hash32", np.uint32, count), ("order32", np.uint32, count),
+                ("blob", np.uint8, blob_size)]
+    layout = {}
+    pos = _HEADER.size
+    for name, dtype, length in sections:
+        pos += -pos % 8
+        layout[name] = (pos, dtype, length)
+        pos += np.dtype(dtype).itemsize * length
+    return layout, pos
+
+
+class NameIndex:
+    """A reverse lookup from FNV hashes to the names that produce them,
+    the way the game hashes names (see fnv.name_hash): 64-bit hashes
+    for instance IDs, 32-bit ones for string table keys and SimData.
+
+    The index is a single file holding the hashes of both sizes as
+    sorted arrays, each with the position of its name, so a lookup is a
+    binary search. The file is memory-mapped rather than read, which
+    makes opening even a large index immediate; only the pages a
+    lookup touches are ever read. Names whose hashes collide are all
+    kept, and the one that was added first is what's reported."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, count, blob_size = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError("%s is not a name index" % (path,))
+        layout, size = _layout(count, blob_size)
+        data = np.memmap(path, dtype=np.uint8, mode="r", shape=(size,))
+        for name, (pos, dtype, length) in layout.items():
+            setattr(self, "_" + name, data[
+                pos:pos + np.dtype(dtype).itemsize * length].view(dtype))
+        self._count = count
+        self._blob_view = memoryview(self._blob)
+
+    @classmethod
+    def build(cls, path, names):
+        """Write an index of names (an iterable of strings) to path,
+        replacing any file that's there, and open it"""
+        names = list(dict.fromkeys(name for name in names if name))
+        encoded = [name.encode("utf-8") for name in names]
+        lengths = np.fromiter(map(len, encoded), dtype=np.uint64,
+                              count=len(encoded))
+        offsets = np.zeros(len(names) + 1, dtype=np.uint64)
+        np.cumsum(lengths, out=offsets[1:])
+        arrays = {"offsets": offsets,
+                  "blob": np.frombuffer(b"".join(encoded), dtype=np.uint8)}
+        for bits in (64, 32):
+            hashes = fnv.fnv1_many(names, bits, lower=True)
+            order = np.argsort(hashes, kind="stable")
+            arrays["hash%d" % (bits,)] = hashes[order]
+            arrays["order%d" % (bits,)] = order.astype(np.uint32)
+
+        layout, size = _layout(len(names), len(arrays["blob"]))
+        buf = bytearray(size)
+        _HEADER.pack_into(buf, 0, _MAGIC, len(names), len(arrays["blob"]))
+        for name, (pos, dtype, length) in layout.items():
+            raw = np.ascontiguousarray(arrays[name], dtype=dtype).tobytes()
+            buf[pos:pos + len(raw)] = raw
+        # Written next to the old index and renamed over it, so that a
+        # reader never sees half an index
+        fd, tmpname = utils.temp_file(os.path.dirname(os.path.abspath(path)))
+        try:
+            with open(fd, "wb") as f:
+                f.write(buf)
+            os.replace(tmpname, path)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+        return cls(path)
+
+    def __len__(self):
+        return self._count
+
+    def _names(self, rows):
+        """Decode the names at rows (an array of name positions)"""
+        blob = self._blob_view
+        return [str(blob[start:end], "utf-8") for start, end in
+                zip(self._offsets[rows].tolist(),
+                    self._offsets[rows + 1].tolist())]
+
+    def names(self):
+        """Iterate over every name in the index"""
+        for first in range(0, self._count, 1 << 16):
+            yield from self._names(np.arange(
+                first, min(first + (1 << 16), self._count)))
+
+    def lookup(self, hashes, bits=64):
+        """Resolve an array of hashes at once. Returns an object array of
+        the same length holding the names, or None where a hash isn't
+        known."""
+        keys = getattr(self, "_hash%d" % (bits,))
+        order = getattr(self, "_order%d" % (bits,))
+        hashes = np.asarray(hashes, dtype=keys.dtype)
+        result = np.empty(len(hashes), dtype=object)
+        if not len(keys):
+            return result
+        pos = np.minimum(np.searchsorted(keys, hashes), len(keys) - 1)
+        found = np.flatnonzero(keys[pos] == hashes)
+        # Each distinct name is only decoded once
+        rows, inverse = np.unique(order[pos[found]], return_inverse=True)
+        decoded = np.empty(len(rows), dtype=object)
+        decoded[:] = self._names(rows)
+        result[found] = decoded[inverse]
+        return result
+
+    def get(self, hash, bits=64, default=None):
+        name = self.lookup([hash], bits)[0]
+        return default if name is None else name
+
+
+def package_names(package):
+    """Collect names from the resources of package (an AbstractPackage)
+    that are likely to be what its instance IDs and hashes were made
+    from: the names of tuning files, and the table and schema names of
+    SimData. Only the root element of each tuning file is parsed, and
+    resources that can't be parsed are skipped."""
+    from s4sdk.resource.simdata import SimDataReader
+    from s4sdk.tuning import read_tuning_header
+    names = set()
+    for rid in package.scan_index(
+            ResourceFilter(type=metadata.ResourceType.OBJ_TUNING.value)):
+        header = read_tuning_header(package[rid].content)
+        if header is not None and header.name:
+            names.add(header.name)
+    for rid in package.scan_index(
+            ResourceFilter(type=metadata.ResourceType.SIM_DATA.value)):
+        try:
+            reader = SimDataReader(package[rid].content, verify_hashes=False)
+        except utils.PARSE_ERRORS:
+            continue
+        names.update(thdr.name for thdr in reader.table_data if thdr.name)
+        names.update(schema.name for schema in reader.schemas.values()
+                     if schema.name)
+    return names
@@ -1,18 +1,34 @@
 # Provides useful tools for working with packages, including metapackage support
+import importlib
 import os.path
 
 from s4sdk import utils
 from s4sdk.package.metapackage import MetaPackage
 from s4sdk.package.dbpf import DbpfPackage
 from s4sdk.package.dirpackage import DirPackage
+from s4sdk.package.sqlitepackage import SqlitePackage
+from s4sdk.package.conflicts import Conflict, find_conflicts
 from s4sdk import metadata
 from s4sdk.resource.abc import Resource
 from s4sdk.resource import Resource as _Resource, ResourceID, ResourceFilter
-from s4sdk.resource.stbl import StringTable, StringTableMetadata
 from s4sdk.resource.binary import BinaryResource
-import pandas as pd
+from s4sdk.resource.simdata import SimData
 from typing import List
 
+# Re-exported from the string table module, which needs NumPy; it's only
+# imported once one of these is used
+_LAZY = ("StringTable", "StringTableMetadata", "StringTablePatch",
+         "StringTableView")
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError("module %r has no attribute %r"
+                             % (__name__, name))
+    value = globals()[name] = getattr(
+        importlib.import_module("s4sdk.resource.stbl"), name)
+    return value
+
 
 def open_package(filename, mode="r"):
     absname = os.path.abspath(filename)
@@ -23,9 +39,11 @@ def open_package(filename, mode="r"):
         if os.path.isdir(filename):
             return DirPackage(absname)
         with open(filename, "rb") as f:
-            magic = f.read(4)
-            if magic == b"DBPF":
+            magic = f.read(16)
+            if magic[:4] == b"DBPF":
                 return DbpfPackage(filename)
+            if magic == SqlitePackage.MAGIC:
+                return SqlitePackage(filename)
         if filename.lower().endswith(".meta"):
             # It's a metapackage...
             try:
@@ -36,6 +54,8 @@ def open_package(filename, mode="r"):
     elif mode == 'w':
         if filename.endswith(".package"):
             return DbpfPackage(filename, "w")
+        elif filename.endswith(SqlitePackage.EXTENSIONS):
+            return SqlitePackage(filename, "w")
         elif filename.endswith("/") or os.path.isdir(filename):
             return DirPackage(filename, mode="w")
 
@@ -56,16 +76,20 @@ class Package:
             raise ValueError(f"Package file at {path} already exist")
         return cls(dbfile=open_package(path, mode="w"))
 
-    def list(self):
-        return pd.DataFrame.from_dict({
-            idx: {
-                "type": instance.type,
-                "group": instance.group,
-                "instance_id": instance.instance,
-                "resource_key": instance
-            }
-            for idx, instance in enumerate(self.instances)
-        }, orient="index")
+    def list(self, names=None) -> utils.Columns:
+        """One row per resource, with type, group, instance_id and
+        resource_key columns. Given a names.NameIndex, there is also a
+        name column: the name each instance ID is the hash of, where
+        it's known. Call .to_pandas() on the result for a DataFrame."""
+        columns = {
+            "type": [instance.type for instance in self.instances],
+            "group": [instance.group for instance in self.instances],
+            "instance_id": [instance.instance for instance in self.instances],
+            "resource_key": list(self.instances),
+        }
+        if names is not None:
+            columns["name"] = names.lookup(columns["instance_id"], 64)
+        return utils.Columns(columns)
 
     def get(self, instance_id: int | List[int]) -> Resource:
         if not isinstance(instance_id, list):
@@ -75,9 +99,16 @@ class Package:
                 instance_id.remove(instance.instance)
                 _resource = self.dbfile[instance]
                 if _resource.id.type == metadata.ResourceType.STBL.value:
+                    from s4sdk.resource.stbl import StringTable
                     stbl = StringTable.read_bytes(bstr=_resource.content)
                     stbl._instance = instance.instance
                     return stbl
+                elif _resource.id.type == metadata.ResourceType.SIM_DATA.value:
+                    return SimData(
+                        content=_resource.content,
+                        group=instance.group,
+                        instance=instance.instance
+                    )
                 else:
                     return BinaryResource(
                         type=metadata.classify_type(instance.type),
@@ -88,6 +119,18 @@ class Package:
         if instance_id:
             raise ValueError(f"Cannot find these instance in the package: {instance_id}")
 
+    def strings(self, locale=None) -> dict:
+        """Key hash to string for every string table in the package; see
+        AbstractPackage.strings"""
+        return self.dbfile.strings(locale)
+
+    def write_strings(self, path: str, delimiter: str = ",", locale=None):
+        """Stream every string table entry in the package to a CSV (or
+        TSV) file; see localization.write_strings"""
+        from s4sdk import localization
+        return localization.write_strings(self.dbfile, path,
+                                          delimiter=delimiter, locale=locale)
+
     def insert(self, resource: Resource | List[Resource]):
         if not isinstance(resource, list):
             resource = [resource]
@@ -95,6 +138,25 @@ class Package:
             self.dbfile.put(rid=rsrc.rid, content=rsrc.content)
             self.dbfile.commit()
 
+    def apply_patch(self, instance_id: int, patch: "StringTablePatch"):
+        """Patch a string table in a writable package. The patch is
+        spliced into the stored table, so strings it doesn't touch are
+        never decoded or re-encoded.
+
+        A DBPF file opened for writing starts out empty, so only tables
+        put since then can be patched in one; to patch an existing DBPF,
+        copy it to a DirPackage or SqlitePackage first."""
+        if not getattr(self.dbfile, "writable", False):
+            raise TypeError("Not a writable package")
+        for instance in self.instances:
+            if (instance.instance == instance_id
+                    and instance.type == metadata.ResourceType.STBL.value):
+                content = patch.apply_to_bytes(self.dbfile[instance].content)
+                self.dbfile.put(instance, content)
+                self.dbfile.commit()
+                return
+        raise ValueError(f"Cannot find string table {instance_id} in the package")
+
     def remove(self, instance_id: int | List[int]):
         if not isinstance(instance_id, list):
             instance_id = [instance_id]
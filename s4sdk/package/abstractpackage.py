@@ -1,11 +1,14 @@
 import abc
-from s4sdk import resource
+from s4sdk import metadata, utils
 
 
 class AbstractPackage(metaclass=abc.ABCMeta):
 
     def __init__(self):
-        self.__stbl_cache = None
+        # Bumped whenever the package's content changes, so that derived
+        # data (such as merged string tables) knows to rebuild itself
+        self.generation = 0
+        self._strings_cache = {}
 
     @abc.abstractmethod
     def scan_index(self, filter=None):
@@ -32,15 +35,42 @@ class AbstractPackage(metaclass=abc.ABCMeta):
         database formats may not need an index cache due to use of an
         efficient file format."""
 
+    def _changed(self):
+        """Called by implementations whenever resources are added,
+        replaced or removed"""
+        self.generation += 1
+        self._strings_cache = {}
+
+    def signature(self):
+        """Something that changes whenever the package's content does, so
+        that indexes of it can tell whether they're stale; None if that
+        can't be told. By default this is the mtime and size of the
+        package file."""
+        return utils.file_signature(getattr(self, "name", None))
+
+    def strings(self, locale=None) -> dict:
+        """Map key hash to string across every string table in the
+        package, optionally only those of one locale (a Locale or its
+        code). Where tables disagree, the one later in the index wins.
+        The result is cached until the package changes; don't modify
+        it."""
+        from s4sdk.localization import stbl_ids
+        from s4sdk.resource.stbl import StringTable
+        if isinstance(locale, metadata.Locale):
+            locale = locale.value
+        try:
+            return self._strings_cache[locale]
+        except KeyError:
+            pass
+        merged = {}
+        for stblid in stbl_ids(self, locale):
+            merged.update(StringTable.read_bytes(self[stblid].content).lookup)
+        self._strings_cache[locale] = merged
+        return merged
+
     @property
     def stbl(self):
-        if self.__stbl_cache is None:
-            self.__stbl_cache = {}
-            for stblid in self.scan_index(
-                    resource.ResourceFilter(type=0x220557DA)):
-                for key, value in stbl.read_stbl(self[stblid]):
-                    self.__stbl_cache[key] = value
-        return self.__stbl_cache
+        return self.strings()
 
     def close(self):
         """Close the package, freeing any OS-level resources if necessary"""
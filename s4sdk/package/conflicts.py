@@ -0,0 +1,114 @@
+# Override/conflict analysis for stacks of packages. Everything in here
+# works off the package indexes; content is only read (and hashed) when
+# two entries can't be told apart from their index records alone.
+
+import hashlib
+from collections import namedtuple
+
+from .dbpf import DbpfLocator
+from .metapackage import MetaPackage
+
+
+class Conflict(namedtuple("Conflict", "id winner shadowed differs")):
+    """A resource ID that is defined by more than one package.
+
+    winner is the Resource that a MetaPackage resolves the ID to;
+    shadowed is a tuple of the Resources it hides, in stack order.
+    differs is a tuple parallel to shadowed; each element is True if
+    that payload differs from the winner's, False if it is identical,
+    or None if that couldn't be decided without reading content.
+    """
+    __slots__ = ()
+
+    @property
+    def identical(self):
+        """True iff every shadowed payload is known to match the winner"""
+        return not any(d is None or d for d in self.differs)
+
+
+class _PayloadComparator:
+    """Decides whether two index entries carry the same payload, reading
+    as little as possible. Digests are cached so that a resource that is
+    shadowed many times is only ever hashed once."""
+
+    def __init__(self, check_content=True):
+        self.check_content = check_content
+        self._raw_digests = {}
+        self._digests = {}
+
+    @staticmethod
+    def _key(rsrc):
+        return id(rsrc.package), rsrc.locator
+
+    def _digest(self, cache, rsrc, read):
+        key = self._key(rsrc)
+        try:
+            return cache[key]
+        except KeyError:
+            digest = cache[key] = hashlib.blake2b(
+                read(rsrc), digest_size=16).digest()
+            return digest
+
+    def raw_digest(self, rsrc):
+        return self._digest(self._raw_digests, rsrc,
+                            rsrc.package._get_raw_content)
+
+    def content_digest(self, rsrc):
+        return self._digest(self._digests, rsrc,
+                            rsrc.package._get_content)
+
+    def differs(self, a, b):
+        if a.size != b.size:
+            return True
+        if a.package is b.package and a.locator == b.locator:
+            return False
+        if not self.check_content:
+            return None
+        if (isinstance(a.locator, DbpfLocator)
+                and isinstance(b.locator, DbpfLocator)
+                and a.locator.compression == b.locator.compression
+                and a.locator.raw_len == b.locator.raw_len):
+            # Same encoding; if the stored bytes match, so does the
+            # content, and we never need to decompress anything.
+            if self.raw_digest(a) == self.raw_digest(b):
+                return False
+        return self.content_digest(a) != self.content_digest(b)
+
+
+def _package_stack(packages):
+    if isinstance(packages, MetaPackage):
+        return packages._package_list
+    return list(packages)
+
+
+def find_conflicts(packages, filter=None, check_content=True):
+    """Yield a Conflict for every resource ID defined in more than one
+    package of the stack.
+
+    packages is either a MetaPackage or a list of packages in the same
+    order as MetaPackage takes them (the last one wins). If
+    check_content is false, no content is ever read, and payloads with
+    matching sizes are reported as undecided.
+    """
+    stack = _package_stack(packages)
+    first = {}
+    duplicates = {}
+    for package in stack:
+        for rid in package.scan_index(filter):
+            rsrc = package[rid]
+            prev = first.setdefault(rid, rsrc)
+            if prev is rsrc:
+                continue
+            try:
+                duplicates[rid].append(rsrc)
+            except KeyError:
+                duplicates[rid] = [prev, rsrc]
+    del first
+
+    comparator = _PayloadComparator(check_content=check_content)
+    for rid, entries in duplicates.items():
+        winner = entries[-1]
+        shadowed = tuple(entries[:-1])
+        yield Conflict(rid, winner, shadowed,
+                       tuple(comparator.differs(winner, rsrc)
+                             for rsrc in shadowed))
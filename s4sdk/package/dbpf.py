@@ -1,4 +1,5 @@
 import io
+import threading
 from collections import namedtuple
 import zlib
 
@@ -119,6 +120,21 @@ class _DbpfWriter:
         locator = DbpfLocator(off, len(zcontent), (0x5A42, 1))
         return locator
 
+    def put_raw_rsrc(self, ibuf, compression):
+        off = self.f.off
+        self.f.put_raw_bytes(ibuf)
+        return DbpfLocator(off, len(ibuf), compression)
+
+    def at(self, posn):
+        return self.f.at(posn)
+
+    def get_raw_bytes(self, count):
+        """Read back content written earlier, at a position set with at()"""
+        return self.f.get_raw_bytes(count)
+
+    def close(self):
+        self.f.close()
+
     def write_index(self, idx):
         with self.f.at(None):
             idx_start = self.f.off
@@ -180,6 +196,10 @@ class DbpfPackage(AbstractPackage):
 
     def __init__(self, name, mode="r"):
         super().__init__()
+        # Reads seek the shared file object; the lock makes content
+        # retrieval safe to call from several threads
+        self._lock = threading.Lock()
+        self.name = name if isinstance(name, str) else None
         if isinstance(name, io.RawIOBase):
             self.file = _DbpfReader(name)
         else:
@@ -209,24 +229,17 @@ class DbpfPackage(AbstractPackage):
             next(self.scan_index())
         return self._index_cache[resource]
 
-    def _get_content(self, item):
+    def _get_raw_content(self, item):
+        """Retrieve the content of item exactly as it is stored in the
+        package, i.e. without decompressing it"""
         assert isinstance(item, resource.Resource)
         assert item.package is self
-        with self.file.at(item.locator.offset):
-            ibuf = self.file.get_raw_bytes(item.locator.raw_len)
-
-        if item.locator.compression[0] == 0:
-            return ibuf  # uncompressed
-        elif item.locator.compression[0] == 0xFFFE:
-            # BUG: I'm guessing "streamable compression" is the same
-            # as RefPack, with a limited buffer size. This may or may
-            # not be true, and even if it is, I'd need to know the
-            # size of the buffer to do anything sensible.
-            return decodeRefPack(ibuf)
-        elif item.locator.compression[0] == 0xFFFF:
-            return decodeRefPack(ibuf)
-        elif item.locator.compression[0] == 0x5A42:
-            return zlib.decompress(ibuf, 15, item.size)
+        with self._lock, self.file.at(item.locator.offset):
+            return self.file.get_raw_bytes(item.locator.raw_len)
+
+    def _get_content(self, item):
+        return decompress(self._get_raw_content(item),
+                          item.locator.compression, item.size)
 
     def flush_index_cache(self):
         # If we're writable, the in-memory "cache" is actually the
@@ -243,6 +256,18 @@ class DbpfPackage(AbstractPackage):
             locator = self.file.put_rsrc(rid, content)
             self._index_cache[rid] = resource.Resource(
                 rid, locator, len(content), self)
+            self._changed()
+        else:
+            raise TypeError("Not a writable package")
+
+    def _put_raw(self, rid, ibuf, size, compression):
+        """Store content that is already encoded with the given DBPF
+        compression, e.g. when copying between packages."""
+        if self.writable:
+            locator = self.file.put_raw_rsrc(ibuf, compression)
+            self._index_cache[rid] = resource.Resource(
+                rid, locator, size, self)
+            self._changed()
         else:
             raise TypeError("Not a writable package")
 
@@ -251,6 +276,23 @@ class DbpfPackage(AbstractPackage):
         self.file.close()
 
 
+def decompress(ibuf, compression, size):
+    """Decode content stored with the given DBPF compression tuple; size
+    is the decompressed size recorded in the index"""
+    if compression[0] == 0:
+        return ibuf  # uncompressed
+    elif compression[0] == 0xFFFE:
+        # BUG: I'm guessing "streamable compression" is the same
+        # as RefPack, with a limited buffer size. This may or may
+        # not be true, and even if it is, I'd need to know the
+        # size of the buffer to do anything sensible.
+        return decodeRefPack(ibuf)
+    elif compression[0] == 0xFFFF:
+        return decodeRefPack(ibuf)
+    elif compression[0] == 0x5A42:
+        return zlib.decompress(ibuf, 15, size)
+
+
 def decodeRefPack(ibuf):
     """Decode the DBPF compression. ibuf must quack like a bytes"""
     # Based on http://simswiki.info/wiki.php?title=Sims_3:DBPF/Compression
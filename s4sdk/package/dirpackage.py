@@ -1,61 +1,311 @@
+import collections
+import json
 import os.path
+import re
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 from .abstractpackage import AbstractPackage
-from .. import resource
+from .. import resource, utils
 
 
 class FileLocator(namedtuple("FileLocator", "filename")):
     pass
 
 
+class _DirState(namedtuple("_DirState", "mtime depth entries subdirs")):
+    """What a single directory contained as of its last scan. entries
+    maps ResourceID to Resource for the files directly inside it."""
+    __slots__ = ()
+
+
 class DirPackage(AbstractPackage):
     """A dirpackage is the most versatile form of package: it is the only
     form that can be opened read/write. It is simply a loose
     collection of properly-named files (in Maxis, S4pe, or colon
     format) in a directory. By default, it writes files in Maxis
-    format. """
+    format.
+
+    Large packages can be sharded into subdirectories by passing a
+    layout other than "flat" (see LAYOUTS). Sharded packages keep a
+    manifest of their contents so that opening them doesn't require
+    listing every subdirectory."""
+
+    # Each layout is a tuple of functions mapping a ResourceID to the
+    # name of the subdirectory at that level
+    LAYOUTS = {
+        "flat": (),
+        "type-group": (lambda rid: "%08x" % (rid.type,),
+                       lambda rid: "%08x" % (rid.group,)),
+        # Instance IDs are already hashes, so their low byte spreads
+        # resources evenly over 256 directories
+        "hash": (lambda rid: "%02x" % (rid.instance & 0xFF,),),
+    }
+
+    # What the top-level subdirectories of each sharded layout are
+    # called, for telling the layout of a package without a manifest
+    _SHARD_NAMES = {
+        "type-group": re.compile(r"[0-9a-f]{8}"),
+        "hash": re.compile(r"[0-9a-f]{2}"),
+    }
 
-    def __init__(self, path, *args, mode="r", config=None, **kwargs):
+    MANIFEST = ".s4manifest.json"
+    MANIFEST_VERSION = 1
+
+    def __init__(self, path, *args, mode="r", config=None, layout=None,
+                 **kwargs):
         """The config file is completely overridden by any config file that
-        already exists in the directory.
+        already exists in the directory. Likewise, the layout of an
+        existing sharded package is taken from its manifest, or if that
+        has gone missing and no layout is given, from the names of its
+        subdirectories. A layout that contradicts either is an error.
         """
         super().__init__()
 
-        self.path = os.path.abspath(path)
+        self.path = self.name = os.path.abspath(path)
+        self._dir_state = {}
+        self._name_cache = {}
+        self._index_cache = None
         if mode == "r":
             if not os.path.exists(self.path):
                 raise FileNotFoundError(
                     "Couldn't open directory package at %s"% (path,))
-            self._index_cache = None
             self.writable = False
         elif mode == "w":
             if not os.path.isdir(self.path):
                 os.makedirs(self.path)
-            self._index_cache = None
             self.writable = True
 
+        try:
+            manifest = self._read_manifest()
+            unreadable = False
+        except utils.FormatException:
+            manifest, unreadable = None, True
+        if manifest is not None:
+            if layout is not None and layout != manifest["layout"]:
+                raise ValueError("%s has layout %r, not %r"
+                                 % (self.path, manifest["layout"], layout))
+            layout = manifest["layout"]
+        elif layout is None:
+            # Without a manifest, a sharded package read as flat would
+            # look empty; its subdirectories say how it's sharded, and
+            # the manifest is rebuilt from a full scan
+            layout = self._detect_layout()
+            if layout is None:
+                if unreadable:
+                    raise utils.FormatException(
+                        "The manifest of %s is unreadable and its layout "
+                        "can't be told from its directories; pass it as "
+                        "layout" % (self.path,))
+                layout = "flat"
+        elif layout != "flat":
+            detected = self._detect_layout()
+            if detected is not None and detected != layout:
+                raise ValueError("%s is sharded as %r, not %r"
+                                 % (self.path, detected, layout))
+        if layout not in self.LAYOUTS:
+            raise ValueError("Unknown DirPackage layout %r" % (layout,))
+        self.layout = layout
+        self._shards = self.LAYOUTS[layout]
+        if manifest is not None:
+            self._load_manifest(manifest)
+        elif self.writable and self._shards:
+            self._write_manifest()
+
     @property
     def _index(self):
-        if self._index_cache is not None:
-            return self._index_cache
-        self._index_cache = {}
-        for fname in os.listdir(self.path):
-            fullpath = os.path.join(self.path, fname)
-            if not os.path.isfile(fullpath):
+        if self._index_cache is None:
+            self._dir_state = {}
+            self._index_cache = {}
+            self._rescan(self.path, 0)
+        return self._index_cache
+
+    def _parse_name(self, fname):
+        """Map a filename to its ResourceID, or None if the file isn't a
+        resource. Results are memoized, as the same names come back on
+        every refresh."""
+        try:
+            return self._name_cache[fname]
+        except KeyError:
+            pass
+        try:
+            rid = resource.ResourceID.from_string(fname)
+        except ValueError:
+            # Ignore the file
+            rid = None
+        self._name_cache[fname] = rid
+        return rid
+
+    def _rescan(self, path, depth):
+        # Take the directory mtime *before* listing, so that anything
+        # that changes while we scan is picked up by the next refresh
+        mtime = os.stat(path).st_mtime_ns
+        entries = {}
+        subdirs = set()
+        with os.scandir(path) as it:
+            for entry in it:
+                if depth < len(self._shards) and entry.is_dir():
+                    subdirs.add(entry.path)
+                    continue
+                rid = self._parse_name(entry.name)
+                if rid is None or not entry.is_file():
+                    continue
+                entries[rid] = resource.Resource(
+                    id=rid,
+                    locator=entry.path,
+                    size=entry.stat().st_size,
+                    package=self)
+        old = self._dir_state.get(path)
+        if old is not None:
+            self._drop_entries(old.entries.keys() - entries.keys(),
+                               old.entries)
+        self._index_cache.update(entries)
+        self._dir_state[path] = _DirState(mtime, depth, entries,
+                                          frozenset(subdirs))
+        if old is not None:
+            for sub in old.subdirs - subdirs:
+                self._drop_dir(sub)
+            subdirs -= old.subdirs
+        for sub in subdirs:
+            self._rescan(sub, depth + 1)
+
+    def _drop_entries(self, rids, entries):
+        for rid in rids:
+            # Only forget the rid if it still refers to this file; the
+            # same resource may also exist elsewhere in the tree
+            if self._index_cache.get(rid) is entries[rid]:
+                del self._index_cache[rid]
+
+    def _drop_dir(self, path):
+        state = self._dir_state.pop(path, None)
+        if state is None:
+            return
+        self._drop_entries(state.entries.keys(), state.entries)
+        for sub in state.subdirs:
+            self._drop_dir(sub)
+
+    def refresh(self):
+        """Bring the index up to date with the directory contents, only
+        rescanning directories that have changed since they were last
+        scanned. Returns whether anything was rescanned.
+
+        Note that a file rewritten in place doesn't change the
+        directory's mtime, so its new size won't be noticed.
+        """
+        if self._index_cache is None:
+            self._index  # builds the cache
+            return True
+        changed = False
+        # Parents sort before their children, so a removed directory is
+        # dropped by its parent's rescan before we'd try to stat it
+        for path in sorted(self._dir_state):
+            state = self._dir_state.get(path)
+            if state is None:
                 continue
             try:
-                rid = resource.ResourceID.from_string(fname)
-            except ValueError:
-                # Ignore the file
-                pass
-            else:
-                self._index_cache[rid] = resource.Resource(
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                self._drop_dir(path)
+                changed = True
+                continue
+            if mtime != state.mtime:
+                self._rescan(path, state.depth)
+                changed = True
+        if changed:
+            self._changed()
+        return changed
+
+    def signature(self):
+        """The directory itself says nothing about files in its
+        subdirectories, so this refreshes the index and combines the
+        mtimes of every directory in the package with the number of
+        resources. As with refresh, a file rewritten in place isn't
+        noticed."""
+        self.refresh()
+        return "%d:%d" % (max(state.mtime for state in
+                              self._dir_state.values()), len(self._index))
+
+    def _read_manifest(self):
+        """The manifest, or None if there isn't one. A manifest that
+        can't be used raises FormatException."""
+        fname = os.path.join(self.path, self.MANIFEST)
+        try:
+            with open(fname, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            raise utils.FormatException(
+                "Corrupt manifest %s: %s" % (fname, e)) from None
+        if not isinstance(manifest, dict) \
+                or manifest.get("version") != self.MANIFEST_VERSION \
+                or "layout" not in manifest or "dirs" not in manifest:
+            raise utils.FormatException(
+                "Unsupported manifest %s" % (fname,))
+        return manifest
+
+    def _detect_layout(self):
+        """The sharded layout that the package's subdirectories are named
+        after, or None if none of them is named like a shard"""
+        if not os.path.isdir(self.path):
+            return None
+        with os.scandir(self.path) as it:
+            names = [entry.name for entry in it if entry.is_dir()]
+        found = [layout for layout, pattern in self._SHARD_NAMES.items()
+                 if any(pattern.fullmatch(name) for name in names)]
+        if len(found) > 1:
+            raise utils.FormatException(
+                "Can't tell whether %s is sharded by %s"
+                % (self.path, " or ".join(found)))
+        return found[0] if found else None
+
+    def _load_manifest(self, manifest):
+        """Rebuild the index from a manifest, then rescan whatever changed
+        since it was written. That costs one stat per directory rather
+        than a listing of every directory."""
+        self._dir_state = {}
+        self._index_cache = {}
+        for relpath, (mtime, depth, files, subdirs) in \
+                manifest["dirs"].items():
+            path = os.path.normpath(os.path.join(self.path, relpath))
+            entries = {}
+            for fname, size in files:
+                rid = self._parse_name(fname)
+                if rid is None:
+                    continue
+                entries[rid] = resource.Resource(
                     id=rid,
-                    locator = fullpath,
-                    size = os.stat(fullpath).st_size,
+                    locator=os.path.join(path, fname),
+                    size=size,
                     package=self)
-        return self._index_cache
+            self._index_cache.update(entries)
+            self._dir_state[path] = _DirState(
+                mtime, depth, entries,
+                frozenset(os.path.join(path, sub) for sub in subdirs))
+        self.refresh()
+
+    def _write_manifest(self):
+        fname = os.path.join(self.path, self.MANIFEST)
+        # The manifest lives in the root directory, so creating it bumps
+        # the root's mtime. Create it first and rewrite it in place
+        # afterwards, which leaves the directory untouched.
+        if not os.path.exists(fname):
+            open(fname, "wb").close()
+        self.refresh()
+        dirs = {}
+        for path, state in self._dir_state.items():
+            dirs[os.path.relpath(path, self.path)] = (
+                state.mtime,
+                state.depth,
+                [(os.path.basename(rsrc.locator), rsrc.size)
+                 for rsrc in state.entries.values()],
+                sorted(os.path.basename(sub) for sub in state.subdirs))
+        with open(fname, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": self.MANIFEST_VERSION,
+                "layout": self.layout,
+                "dirs": dirs,
+            }, f, separators=(",", ":"))
 
     def scan_index(self, filter=None):
         for x in self._index:
@@ -63,18 +313,119 @@ class DirPackage(AbstractPackage):
                 yield x
 
     def _get_content(self, resource):
-        return open(resource.locator, "rb").read()
+        with open(resource.locator, "rb") as f:
+            return f.read()
+
     def __getitem__(self, rid):
         return self._index[rid]
     def flush_index_cache(self):
         self._index_cache = None
+        self._dir_state = {}
+        self._name_cache = {}
+
+    def commit(self):
+        if self.writable and self._shards:
+            self._write_manifest()
+
+    def _dir_for(self, rid):
+        return os.path.join(self.path,
+                            *(shard(rid) for shard in self._shards))
 
-    def put(self, rid, value):
-        fname = os.path.join(self.path, rid.as_filename())
-        with open(fname, "wb") as f:
-            f.write(value)
-        self._index[rid] = resource.Resource(
+    def _write_file(self, rid, content, fsync=False):
+        """Write a resource's file atomically: the content goes to a
+        temporary file in the target directory, which is then renamed
+        over the final name. Safe to call from worker threads."""
+        dirname = self._dir_for(rid)
+        if self._shards:
+            os.makedirs(dirname, exist_ok=True)
+        fname = os.path.join(dirname, rid.as_filename())
+        # The leading dot keeps half-written files from ever parsing as
+        # a resource name
+        fd, tmpname = utils.temp_file(dirname, prefix=".")
+        try:
+            with open(fd, "wb") as f:
+                f.write(content)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmpname, fname)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+        return dirname, resource.Resource(
             id=rid,
             locator=fname,
-            size=len(value),
+            size=len(content),
             package=self)
+
+    def _add_written(self, dirname, rsrc):
+        self._index[rsrc.id] = rsrc
+        self._changed()
+        # A directory created just now isn't tracked yet; its parent's
+        # mtime changed, so the next refresh will pick it up.
+        state = self._dir_state.get(dirname)
+        if state is not None:
+            state.entries[rsrc.id] = rsrc
+
+    @staticmethod
+    def _fsync_dirs(dirnames):
+        for dirname in dirnames:
+            fd = os.open(dirname, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def put(self, rid, content):
+        self._add_written(*self._write_file(rid, content))
+
+    def put_many(self, items, workers=None, fsync=False,
+                 max_pending_bytes=64 << 20):
+        """Write many resources at once. items is an iterable of
+        (rid, content) pairs, which is consumed lazily.
+
+        Files are written atomically by a pool of worker threads. At
+        most max_pending_bytes of content (or a single item, if larger)
+        is held in flight at a time, so items can come straight from
+        another package without reading it all into memory first. If
+        fsync is true, each file is synced before being renamed into
+        place, and every directory that was written to is synced once at
+        the end.
+        """
+        pending = collections.deque()
+        pending_bytes = 0
+        dirnames = set()
+
+        def finish_one():
+            nonlocal pending_bytes
+            future, size = pending.popleft()
+            dirname, rsrc = future.result()
+            pending_bytes -= size
+            dirnames.add(dirname)
+            self._add_written(dirname, rsrc)
+
+        if workers is None:
+            # Same default as ThreadPoolExecutor; this is I/O bound
+            workers = min(32, (os.cpu_count() or 1) + 4)
+        max_pending = workers * 4
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            try:
+                for rid, content in items:
+                    while pending and (
+                            len(pending) >= max_pending or
+                            pending_bytes + len(content) > max_pending_bytes):
+                        finish_one()
+                    pending.append((pool.submit(self._write_file, rid,
+                                                content, fsync),
+                                    len(content)))
+                    pending_bytes += len(content)
+                while pending:
+                    finish_one()
+            except BaseException:
+                # Files that did get written are still valid; the next
+                # refresh will index them
+                for future, _ in pending:
+                    future.cancel()
+                raise
+        if fsync:
+            self._fsync_dirs(dirnames)
@@ -1,4 +1,5 @@
 from .abstractpackage import AbstractPackage
+from .. import metadata
 
 
 class MetaPackage(AbstractPackage):
@@ -35,7 +36,24 @@ class MetaPackage(AbstractPackage):
         # This should never actually get called as we shouldn't be in
         # the package field of any resources. Still, if somebody
         # *does* decide to call this method directly, it should work.
-        return _resource.package._get_content(resource)
+        return resource.package._get_content(resource)
+
+    def strings(self, locale=None) -> dict:
+        """Merge the string tables of every package in the stack, with
+        later packages overriding earlier ones key by key. The result is
+        rebuilt whenever any package in the stack has changed."""
+        if isinstance(locale, metadata.Locale):
+            locale = locale.value
+        generations = tuple(package.generation
+                            for package in self._package_list)
+        cached = self._strings_cache.get(locale)
+        if cached is not None and cached[0] == generations:
+            return cached[1]
+        merged = {}
+        for package in self._package_list:
+            merged.update(package.strings(locale))
+        self._strings_cache[locale] = (generations, merged)
+        return merged
 
     def flush_index_cache(self):
         self._entry_cache = None
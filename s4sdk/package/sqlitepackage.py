@@ -0,0 +1,226 @@
+import os.path
+import pathlib
+import sqlite3
+import threading
+import zlib
+from collections import namedtuple
+
+from .abstractpackage import AbstractPackage
+from .dbpf import DbpfPackage, decompress
+from .. import resource, utils
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    type INTEGER NOT NULL,
+    grp INTEGER NOT NULL,
+    instance INTEGER NOT NULL,
+    compression INTEGER NOT NULL,
+    committed INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (type, grp, instance)
+);
+CREATE INDEX IF NOT EXISTS resources_instance ON resources (instance);
+CREATE INDEX IF NOT EXISTS resources_grp ON resources (grp);
+"""
+
+_ZLIB = (0x5A42, 1)
+
+
+class SqliteLocator(namedtuple("SqliteLocator", "rowid compression")):
+    pass
+
+
+class SqlitePackage(AbstractPackage):
+    """A package stored in an SQLite database. Unlike a DBPF file, it can
+    be updated in place; unlike a DirPackage, it is a single file.
+    Content is stored as it would be in a DBPF (zlib-compressed by
+    default), so copying to and from DBPF files doesn't need to
+    recompress anything.
+
+    Lookups by ResourceID and scans filtered by a ResourceFilter are
+    answered by the database's indexes."""
+
+    MAGIC = b"SQLite format 3\0"
+    EXTENSIONS = (".s4db", ".sqlite")
+
+    def __init__(self, name, mode="r"):
+        super().__init__()
+        self.name = name
+        # The connection is shared between threads, one query at a time;
+        # every use of it holds the lock
+        self._lock = threading.Lock()
+        if mode == "r":
+            if not os.path.exists(name):
+                raise FileNotFoundError(
+                    "No such file or directory: %s" % (name,))
+            self.db = sqlite3.connect(
+                pathlib.Path(name).resolve().as_uri() + "?mode=ro",
+                uri=True, check_same_thread=False)
+            self.writable = False
+        elif mode == "w":
+            self.db = sqlite3.connect(name, check_same_thread=False)
+            self.db.executescript(_SCHEMA)
+            self.writable = True
+        else:
+            raise ValueError("Invalid mode %r" % (mode,))
+
+    @staticmethod
+    def _where(filter):
+        """Translate filter into an SQL WHERE clause (empty if there's
+        nothing to translate) and its parameters. Returns those and
+        whatever part of the filter is left to apply to each rid."""
+        clauses = []
+        params = []
+        if isinstance(filter, (resource.ResourceID, resource.ResourceFilter)):
+            for column, value in (("type", filter.type),
+                                  ("grp", filter.group),
+                                  ("instance", filter.instance)):
+                if value is not None:
+                    if column == "instance":
+                        value = utils.u64_to_sql(value)
+                    clauses.append("%s = ?" % (column,))
+                    params.append(value)
+            filter = None
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return where, params, filter
+
+    def scan_index(self, filter=None):
+        where, params, filter = self._where(filter)
+        # Fetched in one go, so the lock isn't held while the caller
+        # works through the results
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT grp, instance, type FROM resources" + where,
+                params).fetchall()
+        for group, instance, type in rows:
+            rid = resource.ResourceID(group, utils.u64_from_sql(instance),
+                                      type)
+            # Filters we can't translate to SQL are applied as usual
+            if filter is None or filter.match(rid):
+                yield rid
+
+    def __getitem__(self, rid):
+        with self._lock:
+            row = self.db.execute(
+                "SELECT rowid, compression, committed, size FROM resources "
+                "WHERE type = ? AND grp = ? AND instance = ?",
+                (rid.type, rid.group, utils.u64_to_sql(rid.instance))
+            ).fetchone()
+        if row is None:
+            raise KeyError(rid)
+        rowid, compression, committed, size = row
+        return resource.Resource(
+            rid, SqliteLocator(rowid, (compression, committed)), size, self)
+
+    def _get_raw_content(self, item):
+        """Retrieve the content of item as it is stored, without
+        decompressing it"""
+        assert item.package is self
+        with self._lock:
+            return self.db.execute(
+                "SELECT data FROM resources WHERE rowid = ?",
+                (item.locator.rowid,)).fetchone()[0]
+
+    def _get_content(self, item):
+        return decompress(self._get_raw_content(item),
+                          item.locator.compression, item.size)
+
+    def _put_raw(self, rid, ibuf, size, compression):
+        """Store content that is already encoded with the given DBPF
+        compression"""
+        if not self.writable:
+            raise TypeError("Not a writable package")
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO resources "
+                "(type, grp, instance, compression, committed, size, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (rid.type, rid.group, utils.u64_to_sql(rid.instance),
+                 compression[0], compression[1], size, ibuf))
+        self._changed()
+
+    def put(self, rid, content):
+        self._put_raw(rid, zlib.compress(content), len(content), _ZLIB)
+
+    def remove(self, rid):
+        if not self.writable:
+            raise TypeError("Not a writable package")
+        with self._lock:
+            self.db.execute(
+                "DELETE FROM resources "
+                "WHERE type = ? AND grp = ? AND instance = ?",
+                (rid.type, rid.group, utils.u64_to_sql(rid.instance)))
+        self._changed()
+
+    def import_package(self, package, filter=None):
+        """Copy every resource (matching filter) from package into this
+        one, inside a single transaction. Content coming from a DBPF is
+        copied without being decompressed."""
+        if not self.writable:
+            raise TypeError("Not a writable package")
+        if package is self:
+            # rows() would wait on the lock that the insert holds
+            raise ValueError("Can't import a package into itself")
+        raw = isinstance(package, (DbpfPackage, SqlitePackage))
+
+        def rows():
+            for rid in package.scan_index(filter):
+                item = package[rid]
+                if raw:
+                    ibuf = package._get_raw_content(item)
+                    compression = item.locator.compression
+                else:
+                    ibuf = zlib.compress(item.content)
+                    compression = _ZLIB
+                yield (rid.type, rid.group, utils.u64_to_sql(rid.instance),
+                       compression[0], compression[1], item.size, ibuf)
+
+        with self._lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO resources "
+                "(type, grp, instance, compression, committed, size, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows())
+        self._changed()
+
+    def export_dbpf(self, filename, filter=None):
+        """Write this package's resources (matching filter) to a new DBPF
+        file, copying the stored bytes without recompressing them. The
+        file is written under a temporary name and only renamed into
+        place once complete, so a failed export leaves nothing behind."""
+        fd, tmpname = utils.temp_file(
+            os.path.dirname(os.path.abspath(filename)))
+        os.close(fd)
+        where, params, filter = self._where(filter)
+        try:
+            out = DbpfPackage(tmpname, "w")
+            try:
+                with self._lock:
+                    rows = self.db.execute(
+                        "SELECT grp, instance, type, compression, committed, "
+                        "size, data FROM resources" + where, params)
+                    for (group, instance, type, compression, committed,
+                         size, data) in rows:
+                        rid = resource.ResourceID(
+                            group, utils.u64_from_sql(instance), type)
+                        if filter is None or filter.match(rid):
+                            out._put_raw(rid, data, size,
+                                         (compression, committed))
+                out.commit()
+            finally:
+                # Not out.close(), which would write an index even after
+                # a failure
+                out.file.close()
+            os.replace(tmpname, filename)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+
+    def commit(self):
+        if self.writable:
+            with self._lock:
+                self.db.commit()
+
+    def close(self):
+        super().close()
+        self.db.close()
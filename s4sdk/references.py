@@ -0,0 +1,217 @@
+# Which resources refer to which, and extracting a resource along with
+# everything it needs
+
+import collections
+import io
+import re
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from s4sdk import metadata, utils
+from s4sdk.resource import ResourceID
+from s4sdk.resource.simdata import SimDataReader
+from s4sdk.tuning import TuningIndex
+
+# How tuning writes a resource key: type:group:instance, in hex
+_TUNING_KEY = re.compile(r"([0-9A-Fa-f]{8}):([0-9A-Fa-f]{8}):([0-9A-Fa-f]{16})")
+
+
+def tuning_references(content):
+    """The references in a tuning file: a list of the resource keys in
+    its values, and a list of the numbers in its values, which may be
+    the instance IDs of other tuning. What's before a parse error is
+    still returned."""
+    keys, numbers = [], []
+    try:
+        for _, elem in ET.iterparse(io.BytesIO(content)):
+            text = elem.text
+            if text:
+                text = text.strip()
+                if text.isascii() and text.isdigit():
+                    numbers.append(int(text))
+                else:
+                    m = _TUNING_KEY.fullmatch(text)
+                    if m:
+                        keys.append(ResourceID(int(m.group(2), 16),
+                                               int(m.group(3), 16),
+                                               int(m.group(1), 16)))
+            elem.clear()
+    except ET.ParseError:
+        pass
+    return keys, numbers
+
+
+def simdata_references(content):
+    """The resource keys in the RESOURCEKEY fields of a SimData
+    resource, other than null ones"""
+    keys = SimDataReader(content, verify_hashes=False).resource_keys()
+    return [ResourceID(group, instance, type)
+            for instance, type, group in keys.tolist()
+            if instance or type or group]
+
+
+def _extract(package, rid):
+    """(resource keys, instance IDs) that the resource rid refers to"""
+    if rid.type == metadata.ResourceType.SIM_DATA.value:
+        return simdata_references(package[rid].content), []
+    if rid.type in TuningIndex.TYPES:
+        return tuning_references(package[rid].content)
+    return [], []
+
+
+def _reach(indptr, indices, start):
+    """Every node reachable from the nodes in start, start included, by
+    breadth-first search a whole frontier at a time"""
+    seen = np.zeros(len(indptr) - 1, dtype=bool)
+    frontier = np.unique(np.asarray(start, dtype=np.int64))
+    seen[frontier] = True
+    while len(frontier):
+        lo, hi = indptr[frontier], indptr[frontier + 1]
+        lengths = hi - lo
+        edges = np.repeat(lo - (np.cumsum(lengths) - lengths), lengths) \
+            + np.arange(lengths.sum())
+        nodes = np.unique(indices[edges])
+        frontier = nodes[~seen[nodes]]
+        seen[frontier] = True
+    return np.flatnonzero(seen)
+
+
+class ReferenceGraph:
+    """The references between the resources of a package, as a directed
+    graph. Nodes are resource IDs: those in the package, followed by
+    any that are referred to but missing from it. Edges are stored as
+    compressed sparse rows, in the integer arrays indptr and indices:
+    the nodes that node i refers to are indices[indptr[i]:indptr[i+1]].
+
+    References come from the RESOURCEKEY fields of SimData, and from
+    the values of tuning, which hold resource keys and the instance IDs
+    of other tuning. A tuning file also refers to the SimData with its
+    instance ID, which holds its data."""
+
+    def __init__(self, ids, present, indptr, indices, errors=()):
+        self.ids = ids
+        self.present = present
+        self.indptr = indptr
+        self.indices = indices
+        self.errors = list(errors)
+        self._index = {rid: i for i, rid in enumerate(ids)}
+        self._reverse = None
+
+    @classmethod
+    def build(cls, package, workers=None):
+        """Read the references of every resource in package (an
+        AbstractPackage, such as a MetaPackage) with a pool of worker
+        threads. Resources that can't be parsed are left out, with an
+        error noted in errors."""
+        ids = list(package.scan_index())
+        index = {rid: i for i, rid in enumerate(ids)}
+        by_instance = collections.defaultdict(list)
+        for i, rid in enumerate(ids):
+            by_instance[rid.instance].append(i)
+        errors = []
+
+        def extract(rid):
+            try:
+                return _extract(package, rid)
+            except utils.PARSE_ERRORS as e:
+                errors.append("%s: %s" % (rid, e))
+                return [], []
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            extracted = list(pool.map(extract, ids))
+
+        counts = np.zeros(len(ids) + 1, dtype=np.int64)
+        targets = []
+        simdata = metadata.ResourceType.SIM_DATA.value
+        for i, (rid, (keys, numbers)) in enumerate(zip(ids, extracted)):
+            refs = set()
+            for key in keys:
+                j = index.get(key)
+                if j is None:
+                    j = index[key] = len(ids)
+                    ids.append(key)
+                refs.add(j)
+            for number in numbers:
+                refs.update(by_instance.get(number, ()))
+            if rid.type in TuningIndex.TYPES:
+                refs.update(j for j in by_instance[rid.instance]
+                            if ids[j].type == simdata)
+            refs.discard(i)
+            counts[i + 1] = len(refs)
+            targets.extend(sorted(refs))
+        present = np.zeros(len(ids), dtype=bool)
+        present[:len(extracted)] = True
+        counts = np.concatenate([counts, np.zeros(len(ids) - len(extracted),
+                                                  dtype=np.int64)])
+        return cls(ids, present, np.cumsum(counts),
+                   np.array(targets, dtype=np.int32), errors)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _nodes(self, rids):
+        if isinstance(rids, ResourceID):
+            rids = [rids]
+        try:
+            return [self._index[rid] for rid in rids]
+        except KeyError as e:
+            raise KeyError("%s is not in the graph" % (e.args[0],)) from None
+
+    def _reversed(self):
+        """The graph with its edges reversed, in the same form"""
+        if self._reverse is None:
+            sources = np.repeat(np.arange(len(self.ids), dtype=np.int32),
+                                np.diff(self.indptr))
+            order = np.argsort(self.indices, kind="stable")
+            indptr = np.zeros(len(self.ids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.indices, minlength=len(self.ids)),
+                      out=indptr[1:])
+            self._reverse = (indptr, sources[order])
+        return self._reverse
+
+    def references(self, rid):
+        """The resources rid refers to directly"""
+        i, = self._nodes(rid)
+        return [self.ids[j] for j in
+                self.indices[self.indptr[i]:self.indptr[i + 1]].tolist()]
+
+    def referenced_by(self, rid):
+        """The resources that refer to rid directly"""
+        indptr, indices = self._reversed()
+        i, = self._nodes(rid)
+        return [self.ids[j] for j in indices[indptr[i]:indptr[i + 1]].tolist()]
+
+    def closure(self, rids):
+        """Everything that rids (a ResourceID or several) need, directly
+        or not, themselves included"""
+        return [self.ids[i] for i in
+                _reach(self.indptr, self.indices, self._nodes(rids)).tolist()]
+
+    def dependents(self, rids):
+        """Everything that needs rids, directly or not, themselves
+        included"""
+        return [self.ids[i] for i in
+                _reach(*self._reversed(), self._nodes(rids)).tolist()]
+
+    def missing(self, rids):
+        """What rids need, directly or not, that isn't in the package"""
+        return [self.ids[i] for i in
+                _reach(self.indptr, self.indices, self._nodes(rids)).tolist()
+                if not self.present[i]]
+
+    def extract(self, package, rids, dest):
+        """Copy rids and everything they need from package (the one the
+        graph was built from) into dest, a writable package, and commit
+        it. Returns what they need that package doesn't have."""
+        nodes = _reach(self.indptr, self.indices, self._nodes(rids))
+        wanted = [self.ids[i] for i in nodes[self.present[nodes]].tolist()]
+        items = ((rid, package[rid].content) for rid in wanted)
+        if hasattr(dest, "put_many"):
+            dest.put_many(items)
+        else:
+            for rid, content in items:
+                dest.put(rid, content)
+        dest.commit()
+        return [self.ids[i] for i in nodes[~self.present[nodes]].tolist()]
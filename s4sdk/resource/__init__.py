@@ -1,6 +1,6 @@
 from collections import namedtuple
 import re
-import yaml
+import sys
 
 
 class Resource(namedtuple("Resource", 'id locator size package')):
@@ -38,6 +38,16 @@ class ResourceID(namedtuple("ResourceID", "group instance type")):
         'maxis': '^{group}!{instance}.{type}$',
     }
 
+    # All formats folded into one alternation, so that parsing a name
+    # costs a single regex match. Each alternative is wrapped in a group
+    # named after its format, which is what lastgroup reports on a match.
+    PARSER = re.compile("|".join(
+        "(?P<{fmt}>{pattern})".format(fmt=fmt, pattern=pattern.format(
+            type="(?P<%s_type>[0-9A-Fa-f]{,8})" % (fmt,),
+            group="(?P<%s_group>[0-9A-Fa-f]{,8})" % (fmt,),
+            instance="(?P<%s_instance>[0-9A-Fa-f]{,16})" % (fmt,)))
+        for fmt, pattern in PARSERS.items()))
+
     for fmt in PARSERS:
         PARSERS[fmt] = re.compile(PARSERS[fmt].format(
             type="(?P<type>[0-9A-Fa-f]{,8})",
@@ -63,23 +73,32 @@ class ResourceID(namedtuple("ResourceID", "group instance type")):
         # - colon-format (group:instance:type)
         # - Maxis format (group!instance.type)
         # - S4 format (S4_type_group_instance(?:%%.*)?)
-        for parser in cls.PARSERS.values():
-            m = parser.match(string)
-            if m:
-                return cls(
-                    int(m.group('group'), 16),
-                    int(m.group('instance'), 16),
-                    int(m.group('type'), 16),
-                )
-        else:
+        m = cls.PARSER.match(string)
+        if m is None:
             raise ValueError("Invalid rid %s" % (string,))
+        fmt = m.lastgroup
+        return cls(
+            int(m.group(fmt + '_group'), 16),
+            int(m.group(fmt + '_instance'), 16),
+            int(m.group(fmt + '_type'), 16),
+        )
 
 
 def _represent_RID(dumper, rid):
     return dumper.represent_scalar('!s4/rid', str(rid))
 
 
-yaml.add_representer(ResourceID, _represent_RID)
+def register_yaml():
+    """Teach PyYAML to dump ResourceIDs as !s4/rid scalars. This happens
+    on import if yaml is already loaded; otherwise call it before
+    dumping, as importing yaml just for this would slow down every
+    import of s4sdk."""
+    import yaml
+    yaml.add_representer(ResourceID, _represent_RID)
+
+
+if "yaml" in sys.modules:
+    register_yaml()
 
 
 class ResourceFilter:
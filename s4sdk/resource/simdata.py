@@ -0,0 +1,1264 @@
+# SimData (DATA) resources: tables of rows laid out according to
+# schemas, which is how the game stores the data half of tuning.
+
+import bisect
+import collections
+import json
+import math
+import struct
+from collections import namedtuple
+from collections.abc import Sequence
+from enum import IntEnum
+from operator import itemgetter
+
+from s4sdk import fnv, metadata, utils
+from s4sdk.resource import ResourceID
+from s4sdk.resource.abc import Resource
+
+
+class DataType(IntEnum):
+    BOOL = 0
+    CHAR8 = 1
+    INT8 = 2
+    UINT8 = 3
+    INT16 = 4
+    UINT16 = 5
+    INT32 = 6
+    UINT32 = 7
+    INT64 = 8
+    UINT64 = 9
+    FLOAT = 10
+    STRING8 = 11
+    HASHEDSTRING8 = 12
+    OBJECT = 13
+    VECTOR = 14
+    FLOAT2 = 15
+    FLOAT3 = 16
+    FLOAT4 = 17
+    TABLESETREFERENCE = 18
+    RESOURCEKEY = 19
+    LOCKEY = 20
+    # Defined by the game, but not in any way useful
+    UNDEFINED = 21
+
+
+# An off32 with this value is a null pointer
+_NULL_OFFSET = -0x80000000
+
+# For each data type: its struct format, its alignment, and a function
+# converting the unpacked fields to a value (None if the single field is
+# the value already). Converters are called as
+# convert(reader, position of the field, *fields); pointers are relative
+# to the position of the field that holds them.
+_PRIMITIVES = {
+    DataType.BOOL: ("B", 1, lambda r, pos, v: v != 0),
+    DataType.CHAR8: ("B", 1, lambda r, pos, v: chr(v)),
+    DataType.INT8: ("b", 1, None),
+    DataType.UINT8: ("B", 1, None),
+    DataType.INT16: ("h", 2, None),
+    DataType.UINT16: ("H", 2, None),
+    DataType.INT32: ("i", 4, None),
+    DataType.UINT32: ("I", 4, None),
+    DataType.INT64: ("q", 8, None),
+    DataType.UINT64: ("Q", 8, None),
+    DataType.FLOAT: ("f", 4, None),
+    DataType.STRING8: ("i", 4, lambda r, pos, off: r._string(pos, off)),
+    DataType.HASHEDSTRING8: ("iI", 4,
+                             lambda r, pos, off, _: r._string(pos, off)),
+    DataType.OBJECT: ("i", 4, lambda r, pos, off: r._ref(pos, off, None)),
+    DataType.VECTOR: ("iI", 4,
+                      lambda r, pos, off, count: r._ref(pos, off, count)),
+    DataType.FLOAT2: ("2f", 4, lambda r, pos, *v: v),
+    DataType.FLOAT3: ("3f", 4, lambda r, pos, *v: v),
+    DataType.FLOAT4: ("4f", 4, lambda r, pos, *v: v),
+    DataType.TABLESETREFERENCE: ("Q", 8,
+                                 lambda r, pos, v: ("tablesetref", v)),
+    DataType.RESOURCEKEY: ("QII", 8, lambda r, pos, instance, type, group:
+                           ResourceID(group, instance, type)),
+    DataType.LOCKEY: ("I", 4, lambda r, pos, v: ("lockey", v)),
+}
+
+# The inverse of the converters: functions turning a value into the
+# fields to pack, called as encode(writer, position of the field, value).
+# Types not listed pack their value as it is.
+_ENCODERS = {
+    DataType.BOOL: lambda w, pos, v: (1 if v else 0,),
+    DataType.CHAR8: lambda w, pos, v: (ord(v),),
+    DataType.STRING8: lambda w, pos, v: (w._string_offset(pos, v),),
+    DataType.HASHEDSTRING8: lambda w, pos, v: (
+        w._string_offset(pos, v),
+        fnv.fnv1(v.encode("utf-8"), 32) if v is not None else 0),
+    DataType.OBJECT: lambda w, pos, v: (w._object_offset(pos, v),),
+    DataType.VECTOR: lambda w, pos, v: w._vector_fields(pos, v),
+    DataType.FLOAT2: lambda w, pos, v: tuple(v),
+    DataType.FLOAT3: lambda w, pos, v: tuple(v),
+    DataType.FLOAT4: lambda w, pos, v: tuple(v),
+    DataType.TABLESETREFERENCE: lambda w, pos, v: (v[1],),
+    DataType.RESOURCEKEY: lambda w, pos, v: (v.instance, v.type, v.group),
+    DataType.LOCKEY: lambda w, pos, v: (v[1],),
+}
+
+
+def _encode_plain(writer, pos, value):
+    return (value,)
+
+
+# NumPy dtypes of the fields of each data type, as stored, and the dtype
+# a column of that type is exported as, if different. Strings become
+# Python strings; references become the table and row they point to,
+# with a table of -1 for null.
+_REF_DTYPE = [("table", "<i4"), ("row", "<i4")]
+_NUMPY_TYPES = {
+    DataType.BOOL: ("u1", "?"),
+    DataType.CHAR8: ("S1", None),
+    DataType.INT8: ("i1", None),
+    DataType.UINT8: ("u1", None),
+    DataType.INT16: ("<i2", None),
+    DataType.UINT16: ("<u2", None),
+    DataType.INT32: ("<i4", None),
+    DataType.UINT32: ("<u4", None),
+    DataType.INT64: ("<i8", None),
+    DataType.UINT64: ("<u8", None),
+    DataType.FLOAT: ("<f4", None),
+    DataType.STRING8: ("<i4", "O"),
+    DataType.HASHEDSTRING8: ([("off", "<i4"), ("hash", "<u4")], "O"),
+    DataType.OBJECT: ("<i4", _REF_DTYPE),
+    DataType.VECTOR: ([("off", "<i4"), ("count", "<u4")],
+                      _REF_DTYPE + [("count", "<u4")]),
+    DataType.FLOAT2: (("<f4", (2,)), None),
+    DataType.FLOAT3: (("<f4", (3,)), None),
+    DataType.FLOAT4: (("<f4", (4,)), None),
+    DataType.TABLESETREFERENCE: ("<u8", None),
+    DataType.RESOURCEKEY: ([("instance", "<u8"), ("type", "<u4"),
+                            ("group", "<u4")], None),
+    DataType.LOCKEY: ("<u4", None),
+}
+
+
+# The largest alignment of any data type
+_MAX_ALIGN = 8
+
+# Tables start at multiples of this when writing
+_TABLE_ALIGN = 16
+
+_HEADER = struct.Struct("<4sIiiii")
+_TABLE_HEADER = struct.Struct("<iIiIIiI")
+_SCHEMA_HEADER = struct.Struct("<iIIIiI")
+_COLUMN_HEADER = struct.Struct("<iIHHIi")
+
+
+class Schema(namedtuple("Schema", "name schema_hash size columns")):
+    """The layout of the rows of a table. columns is a tuple of
+    SchemaColumns."""
+    __slots__ = ()
+
+
+class SchemaColumn(namedtuple("SchemaColumn",
+                              "name data_type flags offset schema_pos")):
+    """schema_pos is, as read, the file position of the schema of the
+    objects the column refers to (or None). When writing it can also be
+    the Schema itself."""
+    __slots__ = ()
+
+
+def _name_hash(name):
+    # As SimDataReader checks them, which lowercases ASCII only
+    return fnv.fnv1((name or "").encode("utf-8").lower(), 32)
+
+
+class SimDataObject:
+    """A row of a schema'd table. Columns can be read as items or as
+    attributes, and iterating gives the column names; references to
+    other tables are followed on access. There are deliberately no
+    public methods or attributes, which could shadow a column."""
+
+    __slots__ = ("_schema", "_index", "_values")
+
+    def __init__(self, schema, index, values):
+        # index maps column names to positions in values; it's shared
+        # by every row of a table
+        self._schema = schema
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, name):
+        val = self._values[self._index[name]]
+        if isinstance(val, utils.Thunk):
+            return val.value
+        return val
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError("%s not found in schema" % (name,)) from None
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __repr__(self):
+        return "<SimDataObject %s: %s>" % (self._schema.name,
+                                           ", ".join(self._index))
+
+
+def make_object(schema, values):
+    """Create a SimDataObject of schema from a mapping of column names to
+    values. Every column must be given."""
+    index = {column.name: i for i, column in enumerate(schema.columns)}
+    missing = index.keys() - values.keys()
+    if missing:
+        raise KeyError("No value for column(s) %s" % (", ".join(sorted(missing)),))
+    return SimDataObject(schema, index,
+                         [values[column.name] for column in schema.columns])
+
+
+def _row_values(obj):
+    """The column values of obj, with references resolved"""
+    return [val.value if isinstance(val, utils.Thunk) else val
+            for val in obj._values]
+
+
+class SimDataVector(list):
+    """The rows a VECTOR column refers to. It's a plain list that also
+    records what its elements are: their schema, or for a vector of
+    primitive values, their data type. Plain lists can be written too,
+    as long as they hold SimDataObjects."""
+
+    def __init__(self, items=(), schema=None, data_type=None):
+        super().__init__(items)
+        self.schema = schema
+        self.data_type = data_type
+
+
+class _RowCodec:
+    """The columns of a table compiled into a single struct.Struct that
+    packs or unpacks a whole row, padding included, so that tables can be
+    decoded with iter_unpack. Column positions are aligned as the game aligns
+    them, relative to the file, so a decoder is only valid for rows
+    starting at the given phase (offset modulo _MAX_ALIGN), or at least
+    the same phase modulo align, the largest alignment of its columns.
+
+    columns is a sequence of (name, data_type, offset) triples."""
+
+    def __init__(self, columns, row_size, phase):
+        fields = []
+        self.align = 1
+        encoders = []
+        for col, (name, data_type, offset) in enumerate(columns):
+            try:
+                fmt, align, convert = _PRIMITIVES[data_type]
+            except KeyError:
+                raise utils.FormatException(
+                    "Unknown data type %d" % (data_type,)) from None
+            offset += -(phase + offset) % align
+            self.align = max(self.align, align)
+            fields.append((offset, col, struct.Struct("<" + fmt), convert))
+            encoders.append((offset, _ENCODERS.get(data_type, _encode_plain)))
+        # Where each column actually is, once aligned
+        self.offsets = [offset for offset, _, _, _ in fields]
+
+        # Lay the fields out in offset order, with pad bytes between
+        # them, and note where each column's values land in the
+        # unpacked tuple
+        parts = ["<"]
+        end = 0
+        first = [0] * len(fields)
+        width = [0] * len(fields)
+        num_values = 0
+        for offset, col, field, _ in sorted(fields, key=itemgetter(0)):
+            if offset < end:
+                raise utils.FormatException("Overlapping columns")
+            if offset > end:
+                parts.append("%dx" % (offset - end,))
+            parts.append(field.format[1:])
+            end = offset + field.size
+            first[col] = num_values
+            width[col] = len(field.unpack(bytes(field.size)))
+            num_values += width[col]
+        if end > row_size:
+            raise utils.FormatException("Row doesn't fit its schema")
+        if row_size > end:
+            parts.append("%dx" % (row_size - end,))
+        self.struct = struct.Struct("".join(parts))
+
+        getter = itemgetter(*first) if first else (lambda row: ())
+        self._get = (getter if len(first) != 1
+                     else lambda row: (getter(row),))
+        # (column, first and last unpacked value, field offset, converter)
+        # for each column whose value needs converting
+        self.converted = [(col, first[col], first[col] + width[col], offset,
+                           convert)
+                          for offset, col, _, convert in fields
+                          if convert is not None]
+        self.num_values = num_values
+        # (first and last packed value, field offset, encoder) by column
+        self.encoders = [(first[col], first[col] + width[col], offset, encode)
+                         for col, (offset, encode) in enumerate(encoders)]
+
+    def decode(self, reader, base, count):
+        """Decode count rows starting at base into lists of column
+        values, in column order"""
+        size = self.struct.size
+        view = memoryview(reader.bstr)[base:base + size * count]
+        if len(view) != size * count:
+            raise utils.FormatException("Table runs off end of file")
+        get = self._get
+        converted = self.converted
+        rows = []
+        row_base = base
+        for fields in self.struct.iter_unpack(view):
+            values = list(get(fields))
+            for col, start, stop, offset, convert in converted:
+                values[col] = convert(reader, row_base + offset,
+                                      *fields[start:stop])
+            rows.append(values)
+            row_base += size
+        return rows
+
+    def decode_row(self, reader, base):
+        try:
+            fields = self.struct.unpack_from(reader.bstr, base)
+        except struct.error:
+            raise utils.FormatException("Table runs off end of file") from None
+        values = list(self._get(fields))
+        for col, start, stop, offset, convert in self.converted:
+            values[col] = convert(reader, base + offset, *fields[start:stop])
+        return values
+
+    def encode_row(self, writer, buf, base, values):
+        """Pack a row of column values into buf at base"""
+        fields = [None] * self.num_values
+        for (start, stop, offset, encode), value in zip(self.encoders,
+                                                        values):
+            fields[start:stop] = encode(writer, base + offset, value)
+        self.struct.pack_into(buf, base, *fields)
+
+
+class SimDataTable(Sequence):
+    """A read-only view of one table. Rows are decoded when they are
+    first indexed and cached from then on; iterating over the table
+    decodes whatever hasn't been yet in one go. References to other
+    tables are only resolved when they are followed, so a malformed
+    reference is reported then rather than when the file is opened."""
+
+    def __init__(self, reader, header):
+        if header.schema is not None and header.schema.size != header.row_size:
+            raise utils.FormatException("Table data and schema don't correspond with each other")
+        self._reader = reader
+        self.header = header
+        self._rows = [None] * header.row_count
+        self._complete = header.row_count == 0
+        self._decoders = {}
+        if header.schema is not None:
+            self._index = {column.name: i for i, column
+                           in enumerate(header.schema.columns)}
+
+    @property
+    def name(self):
+        return self.header.name
+
+    @property
+    def schema(self):
+        return self.header.schema
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _decoder(self, phase):
+        try:
+            return self._decoders[phase]
+        except KeyError:
+            decoder = self._decoders[phase] = self._reader._decoder(
+                self.header, phase)
+            return decoder
+
+    def _wrap(self, values):
+        if self.header.schema is None:
+            return values[0]
+        return SimDataObject(self.header.schema, self._index, values)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        row = self._rows[idx]
+        if row is None:
+            if idx < 0:
+                idx += len(self._rows)
+            header = self.header
+            base = header.row_pos + idx * header.row_size
+            row = self._rows[idx] = self._wrap(
+                self._decoder(base % _MAX_ALIGN).decode_row(self._reader,
+                                                            base))
+        return row
+
+    def __iter__(self):
+        if not self._complete:
+            self._decode_all()
+        return iter(self._rows)
+
+    def _columns(self):
+        """(name, data_type) of each column; a table of primitive values
+        has a single column called value"""
+        if self.header.schema is None:
+            return [("value", self.header.data_type)]
+        return [(column.name, column.data_type)
+                for column in self.header.schema.columns]
+
+    def _raw_views(self, wanted):
+        """NumPy views of the stored fields of the columns numbered in
+        wanted, straight out of the file. Yields (first, period, raw,
+        positions, offsets) for rows first, first + period, and so on:
+        raw has a field f<i> for each wanted column i, positions are
+        where the rows start, and offsets where each column is in them.
+
+        Rows only all start at the same phase if the row size is a
+        multiple of the alignment; otherwise every period-th one does,
+        and each such set of rows is read with a layout of its own."""
+        import numpy as np
+        header = self.header
+        columns = self._columns()
+        try:
+            formats = [_NUMPY_TYPES[columns[i][1]][0] for i in wanted]
+        except KeyError:
+            raise utils.FormatException("Unknown data type") from None
+        if header.row_pos + header.row_size * header.row_count > len(self._reader.bstr):
+            raise utils.FormatException("Table runs off end of file")
+        if not header.row_count:
+            return
+        period = 1
+        align = self._decoder(header.row_pos % _MAX_ALIGN).align
+        if header.row_size % align:
+            period = _MAX_ALIGN // math.gcd(header.row_size, _MAX_ALIGN)
+        stride = header.row_size * period
+        for first in range(min(period, header.row_count)):
+            start = header.row_pos + first * header.row_size
+            offsets = self._decoder(start % _MAX_ALIGN).offsets
+            count = len(range(first, header.row_count, period))
+            raw = np.ndarray((count,), dtype=np.dtype({
+                "names": ["f%d" % (i,) for i in wanted],
+                "formats": formats,
+                "offsets": [offsets[i] for i in wanted],
+                "itemsize": header.row_size,
+            }), buffer=self._reader.bstr, offset=start, strides=(stride,))
+            positions = start + np.arange(count, dtype=np.int64) * stride
+            yield first, period, raw, positions, offsets
+
+    def to_numpy(self):
+        """The table as a NumPy structured array with a field per column
+        (or, for a table of primitive values, a plain array), read
+        straight out of the file rather than row by row. Strings are
+        Python strings, and references are (table, row) pairs, plus a
+        count for vectors, indexing SimData.tables; null references
+        have a table of -1. Tables of the same schema give arrays of the
+        same dtype."""
+        import numpy as np
+        columns = self._columns()
+        try:
+            types = [_NUMPY_TYPES[data_type] for _, data_type in columns]
+        except KeyError:
+            raise utils.FormatException("Unknown data type") from None
+        out = np.empty(self.header.row_count, dtype=[
+            (name, stored if exported is None else exported)
+            for (name, _), (stored, exported) in zip(columns, types)])
+        for first, period, raw, positions, offsets in self._raw_views(
+                range(len(columns))):
+            rows = out[first::period]
+            for i, (name, data_type) in enumerate(columns):
+                rows[name] = _export_column(self._reader, data_type,
+                                            raw["f%d" % (i,)],
+                                            positions + offsets[i])
+        return out if self.header.schema is not None else out["value"]
+
+    def _decode_all(self):
+        header = self.header
+        decoder = self._decoder(header.row_pos % _MAX_ALIGN)
+        if header.row_size % decoder.align == 0:
+            # Every row starts at the same phase, so one decoder does
+            # the whole table in one go
+            rows = decoder.decode(self._reader, header.row_pos,
+                                  header.row_count)
+            for i, values in enumerate(rows):
+                if self._rows[i] is None:
+                    self._rows[i] = self._wrap(values)
+        else:
+            for i in range(header.row_count):
+                self[i]
+        self._complete = True
+
+
+def _export_column(reader, data_type, field, positions):
+    """Convert the stored values of a column, at positions, to how
+    to_numpy exports them"""
+    import numpy as np
+    if data_type == DataType.BOOL:
+        return field != 0
+    if data_type == DataType.STRING8:
+        return reader._strings_at(positions, field)
+    if data_type == DataType.HASHEDSTRING8:
+        return reader._strings_at(positions, field["off"])
+    if data_type == DataType.OBJECT:
+        offsets, counts = field, np.ones(len(field), dtype=np.int64)
+        null = offsets == _NULL_OFFSET
+    elif data_type == DataType.VECTOR:
+        offsets, counts = field["off"], field["count"].astype(np.int64)
+        null = (offsets == _NULL_OFFSET) | (counts == 0)
+    else:
+        return field
+    result = np.empty(len(field), dtype=_NUMPY_TYPES[data_type][1])
+    result["table"], result["row"] = reader._resolve_refs(
+        positions + offsets, counts, null)
+    if data_type == DataType.VECTOR:
+        result["count"] = np.where(null, 0, counts)
+    return result
+
+
+class SimDataReader(utils.BinPacker):
+    """Parses a SimData resource into its schemas and tables.
+
+    tables holds a SimDataTable for every table, in file order, whose
+    rows are SimDataObjects for schema'd tables and plain values for the
+    rest. content maps the name of each named (top-level) table to its
+    single object. Only the rows of named tables are decoded up front;
+    the others are decoded as they're reached.
+
+    The hashes stored with table and schema names are checked against
+    the names unless verify_hashes is false, which saves hashing every
+    name of input that's known to be good."""
+
+    _TableData = namedtuple("_TableData", "name schema data_type row_size row_pos row_count")
+    _Schema = Schema
+    _SchemaColumn = SchemaColumn
+
+    def __init__(self, bstr, verify_hashes=True):
+        super().__init__(bstr)
+        if bstr[0:4] != b'DATA':
+            raise utils.FormatException("This is not a valid simdata file")
+        self.bstr = bstr
+        self.verify_hashes = verify_hashes
+        # Truncated or inconsistent input shows up as all sorts of
+        # low-level errors; report them all the same way
+        try:
+            self._read_headers()
+        except (ValueError, KeyError, IndexError, TypeError,
+                struct.error) as e:
+            raise utils.FormatException(
+                "Malformed simdata file: %s" % (e,)) from e
+
+    def _read_headers(self):
+        self.off = 4
+
+        self.version = self.get_uint32()
+        table_pos = self.get_off32()
+        num_tables = self.get_int32()
+        schema_pos = self.get_off32()
+        num_schemas = self.get_int32()
+
+        self.schemas = {}
+        self.off = schema_pos
+        for _ in range(num_schemas):
+            off = self.off
+            self.schemas[off] = self._read_schema()
+
+        self.off = table_pos
+        self.table_data = [self._read_table_header()
+                           for _ in range(num_tables)]
+        self._index_tables()
+
+        self._decoders = {}
+        self.errors = []
+        self.tables = [SimDataTable(self, thdr) for thdr in self.table_data]
+        self.content = {}
+        for thdr, table in zip(self.table_data, self.tables):
+            if thdr.name is not None:
+                if thdr.row_count != 1:
+                    self.errors.append("Named table with >1 element")
+                else:
+                    self.content[thdr.name] = table[0]
+
+    def _get_name(self):
+        """Read a name and its hash, checking one against the other"""
+        name = self.get_relstring()
+        name_hash = self.get_uint32()
+        if self.verify_hashes:
+            probed_hash = fnv.fnv1((name or b"").lower(), 32)
+            if probed_hash != name_hash:
+                raise utils.FormatException(
+                    "Name hash mismatch: %08x != %08x (%r)"
+                    % (probed_hash, name_hash, name))
+        return name.decode("utf-8") if name is not None else None
+
+    def _read_table_header(self):
+        name = self._get_name()
+        schema_pos = self.get_off32()
+        data_type = self.get_uint32()
+        row_size = self.get_uint32()
+        row_offset = self.get_off32()
+        row_count = self.get_uint32()
+
+        if schema_pos is not None:
+            schema = self.schemas[schema_pos]
+        else:
+            schema = None
+        return self._TableData(name, schema, data_type, row_size, row_offset, row_count)
+
+    def _read_schema(self):
+        name = self._get_name()
+        schema_hash = self.get_uint32()
+        schema_size = self.get_uint32()
+        column_pos = self.get_off32()
+        num_columns = self.get_uint32()
+
+        columns = []
+        with self.at(column_pos):
+            for _ in range(num_columns):
+                c_name = self.get_relstring()
+                self.get_uint32()  # name hash
+                c_data_type = self.get_uint16()
+                c_flags = self.get_uint16()
+                c_offset = self.get_uint32()
+                c_schema_pos = self.get_off32()
+                columns.append(self._SchemaColumn(c_name.decode("utf-8"), c_data_type, c_flags, c_offset, c_schema_pos))
+        return self._Schema(name, schema_hash, schema_size, tuple(columns))
+
+    def _decoder(self, thdr, phase):
+        key = (thdr.schema, thdr.data_type, thdr.row_size, phase)
+        try:
+            return self._decoders[key]
+        except KeyError:
+            pass
+        if thdr.schema is None:
+            columns = [(None, thdr.data_type, 0)]
+        else:
+            columns = [(column.name, column.data_type, column.offset)
+                       for column in thdr.schema.columns]
+        decoder = self._decoders[key] = _RowCodec(columns, thdr.row_size,
+                                                  phase)
+        return decoder
+
+    def _string(self, pos, off):
+        if off == _NULL_OFFSET:
+            return None
+        start = pos + off
+        end = self.bstr.find(b"\0", start)
+        if end == -1:
+            raise utils.FormatException("Unexpected EOF")
+        return self.bstr[start:end].decode("utf-8")
+
+    def resource_keys(self):
+        """Every RESOURCEKEY value in the file, read in bulk without
+        decoding any rows, as a NumPy structured array of instance, type
+        and group"""
+        import numpy as np
+        parts = [np.zeros(0, dtype=_NUMPY_TYPES[DataType.RESOURCEKEY][0])]
+        for table in self.tables:
+            wanted = [i for i, (_, data_type) in enumerate(table._columns())
+                      if data_type == DataType.RESOURCEKEY]
+            if not wanted:
+                continue
+            for _, _, raw, _, _ in table._raw_views(wanted):
+                parts.extend(raw["f%d" % (i,)] for i in wanted)
+        return np.concatenate(parts)
+
+    def _strings_at(self, positions, offsets):
+        """Decode the strings that offsets, relative to positions, point
+        to, each distinct one only once"""
+        import numpy as np
+        strings = np.empty(len(offsets), dtype=object)
+        live = offsets != _NULL_OFFSET
+        unique, inverse = np.unique(positions[live] + offsets[live],
+                                    return_inverse=True)
+        decoded = np.empty(len(unique), dtype=object)
+        decoded[:] = [self._string(pos, 0) for pos in unique.tolist()]
+        strings[live] = decoded[inverse]
+        return strings
+
+    def _ref(self, pos, off, count):
+        """A reference to an object (if count is None) or a vector of
+        count objects, resolved when it's first followed"""
+        if off == _NULL_OFFSET or count == 0:
+            return None if count is None else []
+        return utils.Thunk(lambda: self._deref(pos + off, count))
+
+    def _deref(self, pos, count):
+        table, rows = self.resolve_ref(pos, count or 1)
+        if count is None:
+            return self.tables[table][rows.start]
+        thdr = self.table_data[table]
+        return SimDataVector(self.tables[table][rows], thdr.schema,
+                             None if thdr.schema else thdr.data_type)
+
+    def _index_tables(self):
+        """Sort the (non-empty) tables by position, so that resolve_ref
+        can find the table containing an offset by bisection"""
+        spans = sorted((thdr.row_pos, thdr.row_pos + thdr.row_size * thdr.row_count, i)
+                       for i, thdr in enumerate(self.table_data)
+                       if thdr.row_count and thdr.row_size)
+        self._table_starts = [start for start, _, _ in spans]
+        self._table_spans = spans
+        # The same as arrays, for _resolve_refs, made when first needed
+        self._span_arrays = None
+
+    def _resolve_refs(self, positions, counts, null):
+        """resolve_ref over arrays of positions and counts at once.
+        Returns arrays of table numbers and first rows, which are -1
+        where null is true."""
+        import numpy as np
+        tables = np.full(len(positions), -1, dtype=np.int32)
+        rows = np.full(len(positions), -1, dtype=np.int32)
+        live = ~null
+        positions, counts = positions[live], counts[live]
+        if not len(positions):
+            return tables, rows
+        if self._span_arrays is None:
+            self._span_arrays = (
+                np.array(self._table_spans, dtype=np.int64).reshape(-1, 3),
+                np.array([(thdr.row_pos, thdr.row_size, thdr.row_count)
+                          for thdr in self.table_data],
+                         dtype=np.int64).reshape(-1, 3))
+        spans, headers = self._span_arrays
+        idx = np.searchsorted(spans[:, 0], positions, side="right") - 1
+        if (idx < 0).any() or (positions >= spans[idx, 1]).any():
+            raise utils.FormatException("Object not in a table")
+        table = spans[idx, 2]
+        headers = headers[table]
+        row, misalignment = np.divmod(positions - headers[:, 0],
+                                      headers[:, 1])
+        if misalignment.any():
+            raise utils.FormatException("Unaligned read of an object")
+        if (headers[:, 2] < row + counts).any():
+            raise utils.FormatException("Object runs off end of table")
+        tables[live] = table
+        rows[live] = row
+        return tables, rows
+
+    def resolve_ref(self, pos, count):
+        """Find the table rows that count objects at offset pos occupy.
+        Returns the table's number and a slice of its rows."""
+        idx = bisect.bisect_right(self._table_starts, pos) - 1
+        if idx < 0 or pos >= self._table_spans[idx][1]:
+            raise utils.FormatException("Object not in a table")
+        i = self._table_spans[idx][2]
+        thdr = self.table_data[i]
+        row_idx, misalignment = divmod(pos - thdr.row_pos, thdr.row_size)
+        if misalignment:
+            raise utils.FormatException("Unaligned read of an object")
+        if thdr.row_count < row_idx + count:
+            raise utils.FormatException("Object runs off end of table")
+        return (i, slice(row_idx, row_idx + count))
+
+
+class _Run:
+    """Rows that have to be consecutive in one table: the elements of a
+    vector, a named object, or objects that are only referred to one at
+    a time. key is the rows' Schema, or DataType if they're primitive."""
+
+    __slots__ = ("key", "rows", "pos", "row_size")
+
+    def __init__(self, key, rows):
+        self.key = key
+        self.rows = rows
+        self.pos = None
+        self.row_size = None
+
+
+class _SimDataWriter:
+    """Serializes a graph of SimDataObjects, in three phases:
+
+    1. The graph is walked from the named objects, turning every vector
+       into a run of rows and noting the strings to write. A cache from
+       id(value) to its run preserves structure sharing and stops cycles;
+       vectors holding the very same rows share a single run.
+    2. The runs are packed into one table per schema or primitive type
+       (named objects each get their own table, as the game expects),
+       and everything is given its final position.
+    3. The file is emitted into a buffer allocated at its final size,
+       every row packed in place with the positions known by then.
+
+    Rows that nothing reachable refers to are not written."""
+
+    def __init__(self, version=0x100, schemas=()):
+        self.version = version
+        if isinstance(schemas, dict):
+            # Positions in the file the schemas were read from, which
+            # columns may refer to
+            self._schema_at = schemas
+            schemas = schemas.values()
+        else:
+            self._schema_at = {}
+        self._extra_schemas = list(schemas)
+        self._codecs = {}
+
+    def write(self, objects) -> bytes:
+        self._collect(objects)
+        size = self._layout()
+        return self._emit(size)
+
+    # Phase 1
+
+    def _collect(self, objects):
+        self._named = []
+        self._vectors = {}      # id(vector) -> run
+        self._runs = {}         # (key, ids of rows) -> run
+        self._placed = {}       # id(object) -> (run, row)
+        self._seen = set()
+        self._referenced = []
+        self._strings = {}
+        self._pending = collections.deque()
+        for name, obj in objects.items():
+            if not isinstance(obj, SimDataObject):
+                raise TypeError("Top-level SimData values must be "
+                                "SimDataObjects, not %r" % (obj,))
+            self._add_string(name)
+            run = _Run(obj._schema, [obj])
+            self._named.append((name, run))
+            self._place(run)
+        while self._pending:
+            obj = self._pending.popleft()
+            for column, value in zip(obj._schema.columns, _row_values(obj)):
+                self._visit(column.data_type, value)
+        # Whatever is only referred to by OBJECT columns gets a run per
+        # schema of its own
+        loose = {}
+        for obj in self._referenced:
+            if id(obj) not in self._placed:
+                run = loose.get(obj._schema)
+                if run is None:
+                    run = loose[obj._schema] = _Run(obj._schema, [])
+                self._placed[id(obj)] = (run, len(run.rows))
+                run.rows.append(obj)
+        self._loose = list(loose.values())
+
+    def _add_string(self, string):
+        self._strings.setdefault(string, None)
+
+    def _see(self, obj):
+        if not isinstance(obj, SimDataObject):
+            raise TypeError("Expected a SimDataObject, not %r" % (obj,))
+        if id(obj) not in self._seen:
+            self._seen.add(id(obj))
+            self._pending.append(obj)
+
+    def _visit(self, data_type, value):
+        if data_type == DataType.OBJECT:
+            if value is not None:
+                self._see(value)
+                self._referenced.append(value)
+        elif data_type == DataType.VECTOR:
+            if value:
+                self._add_vector(value)
+        elif data_type in (DataType.STRING8, DataType.HASHEDSTRING8):
+            if value is not None:
+                self._add_string(value)
+
+    def _add_vector(self, vector):
+        if id(vector) in self._vectors:
+            return
+        key = getattr(vector, "schema", None)
+        if key is None:
+            key = getattr(vector, "data_type", None)
+        if key is None:
+            if not isinstance(vector[0], SimDataObject):
+                raise TypeError("Can't tell the data type of the elements "
+                                "of %r; use a SimDataVector" % (vector,))
+            key = vector[0]._schema
+        rows = list(vector)
+        shared = (key, tuple(map(id, rows)))
+        run = self._runs.get(shared)
+        if run is None:
+            run = self._runs[shared] = _Run(key, rows)
+            self._place(run)
+        self._vectors[id(vector)] = run
+
+    def _place(self, run):
+        if isinstance(run.key, Schema):
+            for i, obj in enumerate(run.rows):
+                self._see(obj)
+                if obj._schema != run.key:
+                    raise TypeError("Vector elements have different schemas")
+                self._placed.setdefault(id(obj), (run, i))
+        else:
+            for value in run.rows:
+                self._visit(run.key, value)
+
+    # Phase 2
+
+    def _row_size(self, key):
+        if isinstance(key, Schema):
+            return key.size
+        try:
+            return struct.calcsize("<" + _PRIMITIVES[key][0])
+        except KeyError:
+            raise ValueError("Unknown data type %d" % (key,)) from None
+
+    def _column_schema(self, column):
+        if column.schema_pos is None or isinstance(column.schema_pos, Schema):
+            return column.schema_pos
+        return self._schema_at.get(column.schema_pos)
+
+    def _layout(self):
+        self._tables = [(name, run.key, [run]) for name, run in self._named]
+        by_key = {}
+        for run in list(self._runs.values()) + self._loose:
+            by_key.setdefault(run.key, []).append(run)
+        self._tables.extend((None, key, runs) for key, runs in by_key.items())
+
+        schemas = dict.fromkeys(self._extra_schemas)
+        for _, key, _ in self._tables:
+            if isinstance(key, Schema):
+                schemas.setdefault(key)
+        # Schemas that columns refer to, and theirs in turn
+        todo = list(schemas)
+        while todo:
+            for column in todo.pop().columns:
+                schema = self._column_schema(column)
+                if schema is not None and schema not in schemas:
+                    schemas[schema] = None
+                    todo.append(schema)
+        for schema in schemas:
+            self._add_string(schema.name)
+            for column in schema.columns:
+                self._add_string(column.name)
+        for name, _, _ in self._tables:
+            if name is not None:
+                self._add_string(name)
+
+        pos = self._table_pos = _HEADER.size
+        pos += _TABLE_HEADER.size * len(self._tables)
+        self._schema_pos = pos
+        pos += _SCHEMA_HEADER.size * len(schemas)
+        # Each schema's header position, and its columns' position
+        self._schemas = {}
+        for i, schema in enumerate(schemas):
+            self._schemas[schema] = (
+                self._schema_pos + _SCHEMA_HEADER.size * i, pos)
+            pos += _COLUMN_HEADER.size * len(schema.columns)
+
+        for _, key, runs in self._tables:
+            pos += -pos % _TABLE_ALIGN
+            row_size = self._row_size(key)
+            for run in runs:
+                run.pos = pos
+                run.row_size = row_size
+                pos += row_size * len(run.rows)
+
+        for string in self._strings:
+            self._strings[string] = pos
+            pos += len(string.encode("utf-8")) + 1
+        return pos
+
+    # Phase 3
+
+    def _string_offset(self, pos, string):
+        if string is None:
+            return _NULL_OFFSET
+        return self._strings[string] - pos
+
+    def _object_offset(self, pos, obj):
+        if obj is None:
+            return _NULL_OFFSET
+        run, row = self._placed[id(obj)]
+        return run.pos + row * run.row_size - pos
+
+    def _vector_fields(self, pos, vector):
+        if not vector:
+            return (_NULL_OFFSET, 0)
+        return (self._vectors[id(vector)].pos - pos, len(vector))
+
+    def _codec(self, key, phase):
+        try:
+            return self._codecs[key, phase]
+        except KeyError:
+            pass
+        if isinstance(key, Schema):
+            columns = [(column.name, column.data_type, column.offset)
+                       for column in key.columns]
+        else:
+            columns = [(None, key, 0)]
+        codec = self._codecs[key, phase] = _RowCodec(
+            columns, self._row_size(key), phase)
+        return codec
+
+    def _emit(self, size):
+        buf = bytearray(size)
+        _HEADER.pack_into(buf, 0, b"DATA", self.version, self._table_pos - 8,
+                          len(self._tables), self._schema_pos - 16,
+                          len(self._schemas))
+
+        for schema, (at, column_pos) in self._schemas.items():
+            _SCHEMA_HEADER.pack_into(
+                buf, at, self._string_offset(at, schema.name),
+                _name_hash(schema.name), schema.schema_hash, schema.size,
+                column_pos - (at + 16), len(schema.columns))
+            for i, column in enumerate(schema.columns):
+                at = column_pos + _COLUMN_HEADER.size * i
+                target = self._column_schema(column)
+                _COLUMN_HEADER.pack_into(
+                    buf, at, self._string_offset(at, column.name),
+                    _name_hash(column.name), column.data_type, column.flags,
+                    column.offset,
+                    _NULL_OFFSET if target is None
+                    else self._schemas[target][0] - (at + 16))
+
+        for i, (name, key, runs) in enumerate(self._tables):
+            at = self._table_pos + _TABLE_HEADER.size * i
+            if isinstance(key, Schema):
+                schema_off = self._schemas[key][0] - (at + 8)
+                data_type = DataType.OBJECT
+            else:
+                schema_off = _NULL_OFFSET
+                data_type = key
+            _TABLE_HEADER.pack_into(
+                buf, at, self._string_offset(at, name), _name_hash(name),
+                schema_off, data_type, runs[0].row_size,
+                runs[0].pos - (at + 20), sum(len(run.rows) for run in runs))
+
+            schema_rows = isinstance(key, Schema)
+            for run in runs:
+                base = run.pos
+                for row in run.rows:
+                    self._codec(key, base % _MAX_ALIGN).encode_row(
+                        self, buf, base,
+                        _row_values(row) if schema_rows else (row,))
+                    base += run.row_size
+
+        for string, pos in self._strings.items():
+            data = string.encode("utf-8")
+            buf[pos:pos + len(data)] = data
+        return bytes(buf)
+
+
+def write_simdata(objects, version=0x100, schemas=()) -> bytes:
+    """Serialize objects, a mapping of names to the top-level
+    SimDataObjects, along with everything they refer to. schemas lists
+    extra schemas to write even if no table uses them; it can also be
+    the schemas of a SimDataReader, so that columns' schema positions
+    from that file are carried over."""
+    return _SimDataWriter(version, schemas).write(objects)
+
+
+def _same_schema(a, b):
+    # Compares everything but the schema positions, which depend on
+    # the file
+    return (a.name == b.name and a.schema_hash == b.schema_hash
+            and a.size == b.size and len(a.columns) == len(b.columns)
+            and all(x[:4] == y[:4] for x, y in zip(a.columns, b.columns)))
+
+
+def equivalent(a, b) -> bool:
+    """Whether two SimData values (objects, vectors, or the objects of
+    two whole resources) hold the same data, however they are laid out.
+    NaNs compare equal to each other. Shared and cyclic structure is
+    followed once per pair of objects."""
+    seen = set()
+    stack = [(a, b)]
+    while stack:
+        x, y = stack.pop()
+        if isinstance(x, SimDataObject):
+            if not isinstance(y, SimDataObject):
+                return False
+            if (id(x), id(y)) in seen:
+                continue
+            seen.add((id(x), id(y)))
+            if not _same_schema(x._schema, y._schema):
+                return False
+            stack.extend(zip(_row_values(x), _row_values(y)))
+        elif isinstance(x, dict):
+            if not isinstance(y, dict) or x.keys() != y.keys():
+                return False
+            stack.extend((x[key], y[key]) for key in x)
+        elif isinstance(x, (list, tuple)):
+            if not isinstance(y, (list, tuple)) or len(x) != len(y):
+                return False
+            stack.extend(zip(x, y))
+        elif isinstance(x, float) and x != x:
+            if not (isinstance(y, float) and y != y):
+                return False
+        elif x != y:
+            return False
+    return True
+
+
+# Rows are decoded this many at a time when exporting
+_EXPORT_CHUNK = 1024
+
+
+class _ExportReader(SimDataReader):
+    """Decodes references as the table and row they point to, rather than
+    as the objects there, so that exporting a row decodes nothing else"""
+
+    def _ref(self, pos, off, count):
+        if off == _NULL_OFFSET or count == 0:
+            return None
+        table, rows = self.resolve_ref(pos + off, count or 1)
+        ref = {"table": table, "row": rows.start}
+        if count is not None:
+            ref["count"] = count
+        return ref
+
+
+def _type_name(data_type):
+    try:
+        return DataType(data_type).name
+    except ValueError:
+        return data_type
+
+
+def _json_header(reader):
+    schemas = {id(schema): i for i, schema in enumerate(reader.schemas.values())}
+    return {
+        "version": reader.version,
+        "schemas": [{
+            "name": schema.name,
+            "schema_hash": schema.schema_hash,
+            "size": schema.size,
+            "columns": [{
+                "name": column.name,
+                "data_type": _type_name(column.data_type),
+                "flags": column.flags,
+                "offset": column.offset,
+                "schema": schemas.get(id(reader.schemas.get(column.schema_pos))),
+            } for column in schema.columns],
+        } for schema in reader.schemas.values()],
+        "tables": [{
+            "name": thdr.name,
+            "schema": schemas.get(id(thdr.schema)),
+            "data_type": _type_name(thdr.data_type),
+            "row_size": thdr.row_size,
+            "row_count": thdr.row_count,
+        } for thdr in reader.table_data],
+    }
+
+
+def _json_rows(table):
+    """The rows of a table of an _ExportReader as JSON-ready values,
+    decoded a chunk at a time"""
+    header = table.header
+    reader = table._reader
+    columns = table._columns()
+    names = [name for name, _ in columns]
+    keys = [i for i, (_, data_type) in enumerate(columns)
+            if data_type == DataType.RESOURCEKEY]
+    floats = [i for i, (_, data_type) in enumerate(columns)
+              if data_type == DataType.FLOAT]
+    vectors = [i for i, (_, data_type) in enumerate(columns)
+               if data_type in (DataType.FLOAT2, DataType.FLOAT3,
+                                DataType.FLOAT4)]
+    decoder = table._decoder(header.row_pos % _MAX_ALIGN)
+    if header.row_size % decoder.align == 0:
+        chunks = (decoder.decode(reader, header.row_pos + start * header.row_size,
+                                 min(_EXPORT_CHUNK, header.row_count - start))
+                  for start in range(0, header.row_count, _EXPORT_CHUNK))
+    else:
+        chunks = ([table._decoder(base % _MAX_ALIGN).decode_row(reader, base)]
+                  for base in range(header.row_pos,
+                                    header.row_pos + header.row_size * header.row_count,
+                                    header.row_size))
+    for chunk in chunks:
+        for values in chunk:
+            for i in keys:
+                values[i] = values[i]._asdict()
+            # JSON has no NaN or infinity
+            for i in floats:
+                if not math.isfinite(values[i]):
+                    values[i] = None
+            for i in vectors:
+                if not all(map(math.isfinite, values[i])):
+                    values[i] = [v if math.isfinite(v) else None
+                                 for v in values[i]]
+            yield values[0] if header.schema is None else dict(zip(names, values))
+
+
+def write_json(source, f, lines=False, tag=None, verify_hashes=True):
+    """Export a SimData resource (or its bytes) to the text file f as
+    JSON, streaming it out a table at a time without building the object
+    graph. The document holds the version, the schemas, and the tables
+    with their rows. Rows of schema'd tables are objects keyed by column
+    name; references are {"table", "row"} (plus "count" for vectors),
+    indexing the tables, and schemas are referred to by index. Floats
+    that are NaN or infinite, which JSON can't represent, are written as
+    null.
+
+    With lines=True, writes JSON Lines instead: a header line without
+    the rows, then a line per row of {"table", "row", "value"}. tag is a
+    dict of extra fields to put on every line, to tell resources apart
+    when several are written to the same file."""
+    reader = _ExportReader(getattr(source, "content", source), verify_hashes)
+    header = _json_header(reader)
+    if lines:
+        tag = tag or {}
+        f.write(json.dumps({**tag, **header}) + "\n")
+        for i, table in enumerate(reader.tables):
+            for row, value in enumerate(_json_rows(table)):
+                f.write(json.dumps({**tag, "table": i, "row": row,
+                                    "value": value}) + "\n")
+        return
+    tables = header.pop("tables")
+    f.write(json.dumps(header)[:-1] + ', "tables": [')
+    for i, (info, table) in enumerate(zip(tables, reader.tables)):
+        f.write((", " if i else "") + json.dumps(info)[:-1] + ', "rows": [')
+        for row, value in enumerate(_json_rows(table)):
+            f.write((", " if row else "") + json.dumps(value))
+        f.write("]}")
+    f.write("]}\n")
+
+
+class SimData(Resource):
+    """A SimData resource. Headers are parsed on construction, but table
+    rows only as they are reached (see SimDataTable). objects holds the
+    named top-level objects, which is usually all that's of interest."""
+
+    def __init__(self, content: bytes, group: int = 0, instance: int = None,
+                 verify_hashes: bool = True):
+        super().__init__(type=metadata.ResourceType.SIM_DATA,
+                         content=content, group=group, instance=instance)
+        self._reader = SimDataReader(content, verify_hashes)
+
+    @classmethod
+    def read(cls, path: str):
+        with open(path, "rb") as f:
+            return cls.read_bytes(f.read())
+
+    @classmethod
+    def read_bytes(cls, bstr: bytes, verify_hashes: bool = True):
+        return cls(content=bstr, verify_hashes=verify_hashes)
+
+    @classmethod
+    def from_objects(cls, objects: dict, version: int = 0x100,
+                     schemas=(), group: int = 0, instance: int = None):
+        """Build a resource out of top-level objects; see write_simdata"""
+        return cls(write_simdata(objects, version, schemas), group=group,
+                   instance=instance)
+
+    def to_numpy(self) -> list:
+        """Every table as a NumPy array; see SimDataTable.to_numpy"""
+        return [table.to_numpy() for table in self._reader.tables]
+
+    @property
+    def version(self) -> int:
+        return self._reader.version
+
+    @property
+    def objects(self) -> dict:
+        return self._reader.content
+
+    @property
+    def tables(self) -> list:
+        return self._reader.tables
+
+    @property
+    def schemas(self) -> list:
+        return list(self._reader.schemas.values())
+
+    @property
+    def content(self) -> bytes:
+        return self._bstr
+
+    def write(self, path: str):
+        with open(path, "wb") as file:
+            file.write(self._bstr)
@@ -1,9 +1,176 @@
-import pandas as pd
+import mmap
+import struct
+from collections.abc import Mapping
+
+import numpy as np
 
 from s4sdk.resource.abc import Resource
 from s4sdk import utils, metadata
 from dataclasses import dataclass
-from collections import defaultdict
+
+
+# magic, version, compressed, num_entries, 2 reserved bytes, str_length
+_HEADER_SIZE = 21
+# key_hash, flags, length; followed by length bytes of UTF-8
+_RECORD_HEADER_SIZE = 7
+_get_length = struct.Struct("<H").unpack_from
+
+
+def _scan_records(bstr, num_entries, off=_HEADER_SIZE):
+    """Walk the entry records once, returning the offset of each record
+    and the byte length of its string as arrays. This is the only part
+    of parsing that can't be vectorized, as each record's position
+    depends on the length of the one before it."""
+    offsets = [0] * num_entries
+    lengths = [0] * num_entries
+    for row in range(num_entries):
+        length, = _get_length(bstr, off + 5)
+        offsets[row] = off
+        lengths[row] = length
+        off += _RECORD_HEADER_SIZE + length
+    if off > len(bstr):
+        raise utils.FormatException("String table is truncated")
+    return (np.array(offsets, dtype=np.int64),
+            np.array(lengths, dtype=np.int64))
+
+
+def _decode_strings(raw, offsets, lengths):
+    """Decode the string of every record, given the records' offsets in
+    raw (a uint8 array), with a single UTF-8 decode"""
+    if len(offsets) == 0:
+        return []
+    # Records are contiguous, so dropping everything but the last byte
+    # of each record header leaves the strings in order, each preceded
+    # by that byte. Zero it, and one split() separates them again.
+    end = int(offsets[-1] + _RECORD_HEADER_SIZE + lengths[-1])
+    keep = np.ones(end, dtype=bool)
+    keep[:_HEADER_SIZE] = False
+    keep[(offsets[:, None] + np.arange(_RECORD_HEADER_SIZE - 1)).ravel()] = False
+    blob = raw[:end][keep]
+    blob[lengths.cumsum() + np.arange(len(lengths)) - lengths] = 0
+    if np.count_nonzero(blob == 0) != len(offsets):
+        # Some string contains a NUL; fall back to decoding one by one
+        starts = (offsets + _RECORD_HEADER_SIZE).tolist()
+        return [raw[a:a + n].tobytes().decode("utf-8")
+                for a, n in zip(starts, lengths.tolist())]
+    return blob.tobytes().decode("utf-8").split("\0")[1:]
+
+
+def _get_key_hashes(raw, offsets):
+    return (raw[offsets[:, None] + np.arange(4)]
+            .view("<u4").ravel().astype(np.uint32))
+
+
+def _read_columns(bstr, num_entries, records=None):
+    """Parse the entry records of an STBL into columns: NumPy arrays for
+    key_hash/flags/length and a list of decoded strings. records is the
+    result of _scan_records, if it's already been computed."""
+    offsets, lengths = records or _scan_records(bstr, num_entries)
+    raw = np.frombuffer(bstr, dtype=np.uint8)
+    return {
+        "key_hash": _get_key_hashes(raw, offsets),
+        "flags": raw[offsets + 4],
+        "length": lengths.astype(np.uint16),
+        "val": _decode_strings(raw, offsets, lengths),
+    }
+
+
+_header = struct.Struct("<4sHBQ2xI")
+_record_header = struct.Struct("<IBH")
+_record_dtype = np.dtype([("key_hash", "<u4"), ("flags", "u1"),
+                          ("length", "<u2")])
+
+
+def _empty_columns():
+    return {"key_hash": np.zeros(0, dtype=np.uint32),
+            "flags": np.zeros(0, dtype=np.uint8),
+            "length": np.zeros(0, dtype=np.uint16),
+            "val": np.zeros(0, dtype=object)}
+
+
+def _find_keys(keys, wanted):
+    """For each of wanted, the position of the last occurrence of that
+    key in keys, or -1 where it doesn't occur. A hash join, via pandas'
+    index engine."""
+    index = utils.require("pandas", "pandas").Index(keys)
+    if index.is_unique:
+        return index.get_indexer(wanted)
+    last = np.flatnonzero(~index.duplicated(keep="last"))
+    pos = index[last].get_indexer(wanted)
+    return np.where(pos == -1, -1, last[pos])
+
+
+def _encode_strings(vals):
+    """UTF-8 encode a sequence of strings in one go. Returns the
+    concatenated bytes as a uint8 array and each string's byte length.
+    NaN (as pandas gives for empty CSV cells) encodes as the empty
+    string."""
+    vals = ["" if val != val else val for val in vals]
+    if not vals:
+        return np.zeros(0, dtype=np.uint8), np.zeros(0, dtype=np.int64)
+    joined = np.frombuffer("\0".join(vals).encode("utf-8"), dtype=np.uint8)
+    seps = np.flatnonzero(joined == 0)
+    if len(seps) != len(vals) - 1:
+        # Some string contains a NUL; encode them one by one instead
+        encoded = [val.encode("utf-8") for val in vals]
+        return (np.frombuffer(b"".join(encoded), dtype=np.uint8),
+                np.array([len(e) for e in encoded], dtype=np.int64))
+    ends = np.append(seps, len(joined))
+    lengths = np.diff(ends, prepend=-1) - 1
+    blob = np.delete(joined, seps)
+    return blob, lengths
+
+
+def _compressed_byte(compressed):
+    """The compressed field as the byte that's written. It's read as a
+    signed byte, so signed and unsigned values are both accepted; others
+    don't fit."""
+    if not -0x80 <= compressed <= 0xFF:
+        raise ValueError("compressed must fit in a byte, not %d"
+                         % (compressed,))
+    return compressed & 0xFF
+
+
+def _pack_columns(key_hash, flags, vals, meta_data):
+    """Serialize a whole string table into one preallocated buffer. The
+    fixed-width record headers are built as a NumPy record array and
+    scattered into place around the string bytes. num_entries and
+    str_length in meta_data are recomputed from the columns."""
+    blob, lengths = _encode_strings(vals)
+    if len(lengths) and lengths.max() > 0xFFFF:
+        raise ValueError("String table entry longer than 65535 bytes")
+    num_entries = len(lengths)
+    meta_data.num_entries = num_entries
+    meta_data.str_length = int(lengths.sum()) + num_entries
+
+    records = np.empty(num_entries, dtype=_record_dtype)
+    records["key_hash"] = key_hash
+    records["flags"] = flags
+    records["length"] = lengths
+
+    size = _HEADER_SIZE + _RECORD_HEADER_SIZE * num_entries + len(blob)
+    out = np.empty(size, dtype=np.uint8)
+    out[:_HEADER_SIZE] = np.frombuffer(_header.pack(
+        meta_data.magic, meta_data.version,
+        _compressed_byte(meta_data.compressed), num_entries,
+        meta_data.str_length), dtype=np.uint8)
+    offsets = (_HEADER_SIZE + _RECORD_HEADER_SIZE * np.arange(num_entries)
+               + np.cumsum(lengths) - lengths)
+    header_pos = (offsets[:, None] + np.arange(_RECORD_HEADER_SIZE)).ravel()
+    is_string = np.ones(size, dtype=bool)
+    is_string[:_HEADER_SIZE] = False
+    is_string[header_pos] = False
+    out[header_pos] = records.view(np.uint8)
+    out[is_string] = blob
+    return out
+
+
+def _import_pyarrow():
+    return utils.require("pyarrow", "arrow")
+
+
+def _import_pandas():
+    return utils.require("pandas", "pandas")
 
 
 @dataclass
@@ -28,16 +195,94 @@ class StringTableMetadata:
         str_length = b_pack.get_uint32()
         return cls(magic=magic, version=version, compressed=compressed, num_entries=num_entries, str_length=str_length)
 
+    @classmethod
+    def from_buffer(cls, buf):
+        """Like from_binary_pack, but reads from anything supporting the
+        buffer protocol (bytes, memoryview, mmap) without copying it"""
+        if len(buf) < _HEADER_SIZE:
+            raise utils.FormatException("String table is truncated")
+        magic, version, compressed, num_entries, str_length = \
+            _header.unpack_from(buf)
+        if magic != b'STBL':
+            raise utils.FormatException("Bad magic")
+        if version != 5:
+            raise utils.FormatException("We only support STBLv5")
+        # compressed is signed, as in from_binary_pack
+        compressed -= (compressed & 0x80) << 1
+        return cls(magic=magic, version=version, compressed=compressed, num_entries=num_entries, str_length=str_length)
+
     @classmethod
     def from_empty(cls, num_entries: int, str_length: int):
         return cls(magic=b'STBL', version=5, compressed=0, num_entries=num_entries, str_length=str_length)
 
 
 class StringTable(Resource):
+    """A string table. Its entries are held as plain columns (see
+    columns) until something asks for them as a pandas DataFrame
+    (entries), so reading, looking up and writing tables works without
+    pandas installed."""
+
     def __init__(self, meta_data=None, entries=None):
         super().__init__(type=metadata.ResourceType.STBL)
         self.meta_data = meta_data or StringTableMetadata.from_empty(num_entries=0, str_length=0)
-        self.entries: pd.DataFrame = entries if entries is not None else pd.DataFrame()
+        if entries is not None:
+            self.entries = entries
+        else:
+            self._set_columns(_empty_columns())
+
+    def _set_columns(self, columns: dict):
+        self._columns = utils.Columns(columns)
+        self._entries = None
+        self._lookup = None
+
+    @property
+    def columns(self) -> utils.Columns:
+        """The key_hash, flags, length and val columns, as NumPy arrays
+        (and a list of strings for val)"""
+        if self._entries is None:
+            return self._columns
+        if self._entries.empty:
+            return utils.Columns(_empty_columns())
+        return utils.Columns({
+            name: column.tolist() if column.dtype == object
+            else column.to_numpy()
+            for name, column in self._entries.items()})
+
+    @property
+    def entries(self) -> "pd.DataFrame":
+        """The entries as a DataFrame, built on first use. From then on the
+        DataFrame is the table's content, so it may be modified in
+        place."""
+        if self._entries is None:
+            self._entries = self._columns.to_pandas()
+            self._columns = None
+        return self._entries
+
+    @entries.setter
+    def entries(self, entries: "pd.DataFrame"):
+        self._entries = entries
+        self._columns = None
+        self._lookup = None
+
+    def to_pandas(self) -> "pd.DataFrame":
+        return self.entries
+
+    @property
+    def lookup(self) -> dict:
+        """A dict from key hash to string, built on first use. Assigning
+        entries invalidates it; modify entries in place and it won't
+        notice."""
+        if self._lookup is None:
+            columns = self.columns
+            if columns.empty:
+                self._lookup = {}
+            else:
+                self._lookup = dict(zip(columns["key_hash"].tolist(),
+                                        columns["val"]))
+        return self._lookup
+
+    def get(self, key_hash: int, default=None):
+        return self.lookup.get(key_hash, default)
 
     @classmethod
     def read(cls, path: str):
@@ -49,99 +294,445 @@ class StringTable(Resource):
         b_pack = utils.BinPacker(bstr)
         meta_data = StringTableMetadata.from_binary_pack(b_pack=b_pack)
 
-        content = defaultdict(dict)
-        for row in range(meta_data.num_entries):
-            key_hash = b_pack.get_uint32()
-            flags = b_pack.get_uint8()
-            length = b_pack.get_uint16()
-            val = b_pack.get_raw_bytes(length).decode('utf-8')
-            content["key_hash"][row] = key_hash
-            content["flags"][row] = flags
-            content["length"][row] = length
-            content["val"][row] = val
-        entries = pd.DataFrame.from_dict(content)
-        instance = cls(meta_data=meta_data, entries=entries)
+        instance = cls(meta_data=meta_data)
+        instance._set_columns(_read_columns(bstr, meta_data.num_entries))
         instance._bstr = bstr
         return instance
 
     @classmethod
-    def read_csv(cls, path: str):
-        content = pd.read_csv(path).to_dict()
-        n = len(content["key_hash"])
-        total_len = 0
-        str_len = 0
-        for row in range(0, n):
-            if content["val"][row] != content["val"][row]:
-                new_len = 0
-            else:
-                new_len = len(content["val"][row].encode("utf-8"))
-            content["length"][row] = new_len
-            total_len += new_len
-            str_len += len(content["val"][row]) if new_len else new_len
-
-        num_entries = n
-        str_len = total_len + num_entries
-
+    def read_csv(cls, path: str, chunksize: int = 100_000):
+        """Import a table written by write_csv. The val column is taken
+        verbatim, so strings like "NA" or "null" survive; the length
+        column, if present, is ignored and recomputed. Raises ValueError
+        if key hashes are missing, out of range or duplicated."""
+        pd = _import_pandas()
+        chunks = []
+        for chunk in pd.read_csv(path, encoding="utf-8-sig",
+                                 chunksize=chunksize,
+                                 dtype={"val": object},
+                                 keep_default_na=False,
+                                 na_values={"key_hash": [""], "flags": [""]}):
+            chunks.append(cls._columns_from_csv(chunk))
+        if chunks:
+            entries = pd.concat(chunks, ignore_index=True)
+        else:
+            entries = cls._columns_from_csv(pd.DataFrame(
+                {"key_hash": [], "val": []}))
+        duplicated = entries["key_hash"].duplicated()
+        if duplicated.any():
+            raise ValueError("Duplicate key hashes: %s" % (
+                ", ".join("%08x" % k for k in
+                          entries["key_hash"][duplicated].unique()[:10]),))
+        num_entries = len(entries)
+        str_len = int(entries["length"].sum()) + num_entries
         meta_data = StringTableMetadata.from_empty(num_entries=num_entries, str_length=str_len)
-        entries = pd.DataFrame.from_dict(content)
         return cls(meta_data=meta_data, entries=entries)
 
+    @staticmethod
+    def _columns_from_csv(chunk: "pd.DataFrame") -> "pd.DataFrame":
+        pd = _import_pandas()
+        for column in ("key_hash", "val"):
+            if column not in chunk:
+                raise ValueError("CSV has no %s column" % (column,))
+        key_hash = pd.to_numeric(chunk["key_hash"], errors="coerce")
+        bad = (key_hash.isna() | (key_hash < 0) | (key_hash > 0xFFFFFFFF)
+               | (key_hash != key_hash.round()))
+        if bad.any():
+            raise ValueError("Invalid key hash on CSV row(s) %s" % (
+                ", ".join(str(row + 2) for row in chunk.index[bad][:10]),))
+        if "flags" in chunk:
+            flags = chunk["flags"].fillna(0).astype(np.uint8)
+        else:
+            flags = np.zeros(len(chunk), dtype=np.uint8)
+        val = chunk["val"].fillna("")
+        _, lengths = _encode_strings(val.tolist())
+        if len(lengths) and lengths.max() > 0xFFFF:
+            raise ValueError("String table entry longer than 65535 bytes")
+        return pd.DataFrame({
+            "key_hash": key_hash.astype(np.uint32).to_numpy(),
+            "flags": np.asarray(flags),
+            "length": lengths.astype(np.uint16),
+            "val": val.to_numpy(),
+        })
+
     def write(self, path: str):
-        b_pack = self.pack_bytes()
         with open(path, "wb") as file:
-            file.write(b_pack.raw.getbuffer())
-        b_pack.close()
+            file.write(self._pack())
 
     def write_csv(self, path: str):
         self.entries.to_csv(path, index=False, encoding='utf-8-sig')
 
+    def _columns_or_empty(self) -> "pd.DataFrame":
+        if self.entries.empty:
+            return utils.Columns(_empty_columns()).to_pandas()
+        return self.entries
+
+    def diff(self, other: "StringTable") -> "StringTablePatch":
+        """Compare this table with a newer version of it, returning the
+        patch that turns this one into other. Keys are matched with a
+        hash join, and values and flags compared column by column."""
+        old = self._columns_or_empty().drop_duplicates("key_hash",
+                                                       keep="last")
+        new = other._columns_or_empty().drop_duplicates("key_hash",
+                                                        keep="last")
+        pos = _find_keys(old["key_hash"], new["key_hash"])
+        matched = pos != -1
+        old_pos = pos[matched]
+        differs = ((old["val"].to_numpy()[old_pos]
+                    != new["val"].to_numpy()[matched])
+                   | (old["flags"].to_numpy()[old_pos]
+                      != new["flags"].to_numpy()[matched]))
+        changed = np.zeros(len(new), dtype=bool)
+        changed[np.flatnonzero(matched)[differs]] = True
+        removed = ~old["key_hash"].isin(new["key_hash"]).to_numpy()
+        columns = ["key_hash", "flags", "val"]
+        return StringTablePatch(
+            added=new.loc[~matched, columns].reset_index(drop=True),
+            changed=new.loc[changed, columns].reset_index(drop=True),
+            removed=old["key_hash"].to_numpy()[removed].astype(np.uint32))
+
+    def apply_patch(self, patch: "StringTablePatch"):
+        """Update this table in place. Changed entries keep their
+        position; added ones are appended. An added key that already
+        exists is overwritten, and a changed key that doesn't is
+        added."""
+        entries = self._columns_or_empty()
+        entries = entries[~entries["key_hash"].isin(patch.removed)]
+        entries = entries.reset_index(drop=True)
+        upserts = patch.upserts
+        _, lengths = _encode_strings(upserts["val"].tolist())
+        pos = _find_keys(entries["key_hash"], upserts["key_hash"])
+        existing = pos != -1
+        for column, values in (("flags", upserts["flags"].to_numpy()),
+                               ("length", lengths),
+                               ("val", upserts["val"].to_numpy())):
+            column_values = entries[column].to_numpy().copy()
+            column_values[pos[existing]] = values[existing]
+            entries[column] = column_values
+        pd = _import_pandas()
+        appended = pd.DataFrame({
+            "key_hash": upserts["key_hash"].to_numpy()[~existing],
+            "flags": upserts["flags"].to_numpy()[~existing],
+            "length": lengths[~existing],
+            "val": upserts["val"].to_numpy()[~existing],
+        })
+        entries = pd.concat([entries, appended], ignore_index=True).astype(
+            {"key_hash": np.uint32, "flags": np.uint8, "length": np.uint16})
+        self.entries = entries
+        self.meta_data.num_entries = len(entries)
+        self.meta_data.str_length = (int(entries["length"].sum())
+                                     + len(entries))
+
+    def to_arrow(self):
+        """Convert to a pyarrow Table with the same columns as entries.
+        Numeric columns share memory with the table; string data is
+        encoded into a single buffer that Arrow wraps without copying.
+        Requires the optional pyarrow dependency."""
+        pa = _import_pyarrow()
+        columns = self.columns
+        blob, lengths = _encode_strings(list(columns["val"]))
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        if len(blob) < 2 ** 31:
+            string_type, offsets = pa.string(), offsets.astype(np.int32)
+        else:
+            string_type = pa.large_string()
+        val = pa.Array.from_buffers(
+            string_type, len(lengths),
+            [None, pa.py_buffer(offsets), pa.py_buffer(blob)])
+        metadata = {}
+        if self.instance is not None:
+            metadata[b"s4sdk.instance"] = str(self.instance).encode()
+        return pa.table({
+            "key_hash": pa.array(np.asarray(columns["key_hash"],
+                                            dtype=np.uint32)),
+            "flags": pa.array(np.asarray(columns["flags"], dtype=np.uint8)),
+            "length": pa.array(lengths.astype(np.uint16)),
+            "val": val,
+        }, metadata=metadata)
+
+    @classmethod
+    def from_arrow(cls, table):
+        """Build a StringTable from a pyarrow Table with at least key_hash
+        and val columns (such as one made by to_arrow). Null strings
+        become empty strings and null flags 0; null key hashes are an
+        error."""
+        pa = _import_pyarrow()
+        import pyarrow.compute as pc
+
+        key_column = table.column("key_hash")
+        if key_column.null_count:
+            rows = np.flatnonzero(
+                key_column.is_null().to_numpy(zero_copy_only=False))
+            raise ValueError("Null key hash on row(s) %s" % (
+                ", ".join(str(row) for row in rows[:10]),))
+
+        def numeric(name, dtype):
+            column = pc.fill_null(table.column(name).combine_chunks(), 0)
+            return column.cast(pa.from_numpy_dtype(dtype)).to_numpy()
+
+        key_hash = numeric("key_hash", np.uint32)
+        if "flags" in table.column_names:
+            flags = numeric("flags", np.uint8)
+        else:
+            flags = np.zeros(table.num_rows, dtype=np.uint8)
+        val = pc.fill_null(table.column("val").combine_chunks(), "")
+        lengths = pc.binary_length(val).to_numpy(zero_copy_only=False)
+        meta_data = StringTableMetadata.from_empty(
+            num_entries=table.num_rows,
+            str_length=int(lengths.sum()) + table.num_rows)
+        instance = cls(meta_data=meta_data)
+        instance._set_columns({
+            "key_hash": key_hash,
+            "flags": flags,
+            "length": lengths.astype(np.uint16),
+            "val": val.to_numpy(zero_copy_only=False).tolist(),
+        })
+        instance_id = (table.schema.metadata or {}).get(b"s4sdk.instance")
+        if instance_id is not None:
+            instance._instance = int(instance_id)
+        return instance
+
+    def write_parquet(self, path: str, **kwargs):
+        """Write the table to a Parquet file. Keyword arguments are passed
+        on to pyarrow.parquet.write_table"""
+        _import_pyarrow()
+        import pyarrow.parquet as pq
+        pq.write_table(self.to_arrow(), path, **kwargs)
+
+    @classmethod
+    def read_parquet(cls, path: str):
+        _import_pyarrow()
+        import pyarrow.parquet as pq
+        return cls.from_arrow(pq.read_table(path))
+
     @property
     def content(self) -> bytes:
-        return self.pack_bytes().raw.getvalue()
+        return self._pack().tobytes()
 
     def pack_bytes(self) -> utils.BinPacker:
-        b_pack = utils.BinPacker(bstr=b'', mode='w')
-        self._repack_metadata(b_pack=b_pack)
-        self._repack_content(b_pack=b_pack)
+        b_pack = utils.BinPacker(bstr=self._pack().tobytes(), mode='w')
+        b_pack.off = b_pack.raw_len
         return b_pack
 
-    def _repack_metadata(self, b_pack: utils.BinPacker):
-        b_pack.put_raw_bytes(self.meta_data.magic)
-        b_pack.put_uint16(self.meta_data.version)
-        b_pack.put_uint8(self.meta_data.compressed)
-        b_pack.put_uint64(self.meta_data.num_entries)
-        b_pack.off += 2
-        b_pack.put_uint32(self.meta_data.str_length)
+    def _pack(self):
+        columns = self.columns
+        if columns.empty:
+            return _pack_columns([], [], [], self.meta_data)
+        return _pack_columns(columns["key_hash"], columns["flags"],
+                             list(columns["val"]), self.meta_data)
+
+
+@dataclass
+class StringTablePatch:
+    """The difference between two versions of a string table, as made by
+    StringTable.diff. added and changed hold key_hash, flags and val
+    columns; removed is an array of key hashes."""
+    added: "pd.DataFrame"
+    changed: "pd.DataFrame"
+    removed: np.ndarray
+
+    MAGIC = b"STBP"
+    VERSION = 1
+    # magic, version, number of removed keys, number of changed entries
+    _HEADER = struct.Struct("<4sHQQ")
+
+    @property
+    def upserts(self) -> "pd.DataFrame":
+        return _import_pandas().concat([self.changed, self.added], ignore_index=True)
+
+    def __bool__(self):
+        return bool(len(self.added) or len(self.changed) or len(self.removed))
+
+    def to_bytes(self) -> bytes:
+        """Serialize the patch: a small header, the removed keys, then the
+        changed and added entries encoded as an STBL"""
+        upserts = self.upserts
+        stbl = _pack_columns(upserts["key_hash"].to_numpy(),
+                             upserts["flags"].to_numpy(),
+                             upserts["val"].tolist(),
+                             StringTableMetadata.from_empty(0, 0))
+        return b"".join((
+            self._HEADER.pack(self.MAGIC, self.VERSION, len(self.removed),
+                              len(self.changed)),
+            np.asarray(self.removed, dtype="<u4").tobytes(),
+            stbl.tobytes()))
+
+    @classmethod
+    def from_bytes(cls, bstr: bytes):
+        magic, version, num_removed, num_changed = \
+            cls._HEADER.unpack_from(bstr)
+        if magic != cls.MAGIC:
+            raise utils.FormatException("Bad magic")
+        if version != cls.VERSION:
+            raise utils.FormatException(
+                "Unsupported string table patch version %d" % (version,))
+        off = cls._HEADER.size
+        removed = np.frombuffer(bstr, dtype="<u4", count=num_removed,
+                                offset=off).astype(np.uint32)
+        upserts = StringTable.read_bytes(
+            bstr[off + 4 * num_removed:]).entries
+        columns = ["key_hash", "flags", "val"]
+        if upserts.empty:
+            upserts = _import_pandas().DataFrame(
+                {column: [] for column in columns})
+        return cls(
+            added=upserts.loc[num_changed:, columns].reset_index(drop=True),
+            changed=upserts.loc[:num_changed - 1, columns]
+                           .reset_index(drop=True),
+            removed=removed)
+
+    def apply_to_bytes(self, bstr) -> bytes:
+        """Apply the patch to a serialized string table, returning the
+        patched one. Untouched records are copied over as raw byte
+        ranges, so only the patched entries are ever encoded or
+        decoded."""
+        meta_data = StringTableMetadata.from_buffer(bstr)
+        offsets, lengths = _scan_records(bstr, meta_data.num_entries)
+        keys = _get_key_hashes(np.frombuffer(bstr, dtype=np.uint8), offsets)
+        upserts = self.upserts
+        upsert_keys = upserts["key_hash"].to_numpy().astype(np.uint32)
+        records = [_record_header.pack(int(key), int(flags), len(val))
+                   + val
+                   for key, flags, val in zip(
+                       upsert_keys.tolist(), upserts["flags"].tolist(),
+                       (("" if val != val else val).encode("utf-8")
+                        for val in upserts["val"].tolist()))]
+
+        # Rows of the old table that are replaced in place, and rows
+        # that are dropped
+        pos = _find_keys(keys, upsert_keys)
+        replaced = dict(zip(pos[pos != -1].tolist(),
+                            np.flatnonzero(pos != -1).tolist()))
+        dropped = np.isin(keys, self.removed)
+        touched = sorted(set(replaced) | set(np.flatnonzero(dropped).tolist()))
+
+        segments = []
+        num_entries = meta_data.num_entries
+        str_length = meta_data.str_length
+        prev = _HEADER_SIZE
+        for row in touched:
+            start = int(offsets[row])
+            segments.append(bstr[prev:start])
+            prev = start + _RECORD_HEADER_SIZE + int(lengths[row])
+            num_entries -= 1
+            str_length -= int(lengths[row]) + 1
+            if row in replaced and not dropped[row]:
+                segments.append(records[replaced[row]])
+                num_entries += 1
+                str_length += (len(records[replaced[row]])
+                               - _RECORD_HEADER_SIZE + 1)
+        end = (int(offsets[-1]) + _RECORD_HEADER_SIZE + int(lengths[-1])
+               if len(offsets) else _HEADER_SIZE)
+        segments.append(bstr[prev:end])
+        for i in np.flatnonzero(pos == -1).tolist():
+            segments.append(records[i])
+            num_entries += 1
+            str_length += len(records[i]) - _RECORD_HEADER_SIZE + 1
+        header = _header.pack(meta_data.magic, meta_data.version,
+                              _compressed_byte(meta_data.compressed),
+                              num_entries, str_length)
+        return b"".join([header] + [bytes(segment) for segment in segments])
+
+
+class StringTableView(Mapping):
+    """A read-only Mapping from key hash to string over the raw bytes of
+    a string table. Opening a view only locates the records; strings are
+    decoded when they are looked up. As with a dict built from the
+    table, a key that appears more than once maps to its last value.
+
+    buffer may be anything supporting the buffer protocol, notably an
+    mmap; see StringTableView.open.
+    """
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self._mmap = None
+        self.meta_data = StringTableMetadata.from_buffer(buffer)
+        self._offsets, self._lengths = _scan_records(
+            buffer, self.meta_data.num_entries)
+        keys = _get_key_hashes(np.frombuffer(buffer, dtype=np.uint8),
+                               self._offsets)
+        # Sort keys for binary search; with a stable sort, the last of
+        # a run of equal keys is the last occurrence in the table
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        last = np.ones(len(keys), dtype=bool)
+        last[:-1] = keys[1:] != keys[:-1]
+        self._keys = keys[last]
+        self._rows = order[last]
+
+    @classmethod
+    def open(cls, path: str):
+        """Memory-map an .stbl file and open a view over it"""
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = cls(mm)
+        view._mmap = mm
+        return view
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _row(self, key_hash):
+        i = np.searchsorted(self._keys, key_hash)
+        if i == len(self._keys) or self._keys[i] != key_hash:
+            raise KeyError(key_hash)
+        return self._rows[i]
+
+    def __getitem__(self, key_hash):
+        row = self._row(key_hash)
+        start = int(self._offsets[row]) + _RECORD_HEADER_SIZE
+        return str(self._buffer[start:start + int(self._lengths[row])],
+                   "utf-8")
+
+    def __contains__(self, key_hash):
+        try:
+            self._row(key_hash)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        # In table order
+        return iter(self._keys[np.argsort(self._rows)].tolist())
+
+    def __len__(self):
+        return len(self._keys)
+
+    def to_string_table(self) -> StringTable:
+        """Decode the whole table into a StringTable"""
+        table = StringTable(meta_data=StringTableMetadata(
+            **vars(self.meta_data)))
+        table._set_columns(_read_columns(
+            self._buffer, self.meta_data.num_entries,
+            records=(self._offsets, self._lengths)))
+        return table
+
 
-    def _repack_content(self, b_pack: utils.BinPacker):
-        contents = self.entries.to_dict(orient="index")
-        for row, content in contents.items():
-            b_pack.put_uint32(content.get("key_hash"))
-            b_pack.put_uint8(content.get("flags"))
-            b_pack.put_uint16(content.get("length"))
-            val = content.get("val")
-            b_pack.put_raw_bytes("".encode("utf-8") if val != val else val.encode("utf-8"))
+def iter_stbl(bstr):
+    """Yield (key_hash, flags, value) for each entry of a string table,
+    decoding one entry at a time"""
+    meta_data = StringTableMetadata.from_buffer(bstr)
+    off = _HEADER_SIZE
+    for _ in range(meta_data.num_entries):
+        key_hash, flags, length = _record_header.unpack_from(bstr, off)
+        off += _RECORD_HEADER_SIZE
+        if off + length > len(bstr):
+            raise utils.FormatException("String table is truncated")
+        yield key_hash, flags, str(bstr[off:off + length], "utf-8")
+        off += length
 
 
 def read_stbl(bstr):
     """Parse a string table (ID 0x220557DA)"""
-    f = utils.BinPacker(bstr)
-    if f.get_raw_bytes(4) != b'STBL':
-        raise utils.FormatException("Bad magic")
-    version = f.get_uint16()
-    if version != 5:
-        raise utils.FormatException("We only support STBLv5")
-    compressed = f.get_uint8()
-    numEntries = f.get_uint64()
-    f.off += 2
-    mnStringLength = f.get_uint32()
-    # This is the total size of all the strings plus one null byte per string (to make the parsing code faster, probably)
-
-    entries = {}
-    size = 0
-    for _ in range(numEntries):
-        keyHash = f.get_uint32()
-        flags = f.get_uint8() # What is in this? It's always 0.
-        length = f.get_uint16()
-        val = f.get_raw_bytes(length).decode('utf-8')
-        yield keyHash, val
+    for key_hash, _, val in iter_stbl(bstr):
+        yield key_hash, val
@@ -0,0 +1,99 @@
+# A persistent full-text index over the strings of packages
+
+import itertools
+from collections import namedtuple
+
+from s4sdk.catalog import PackageCatalog
+from s4sdk.localization import stbl_ids
+from s4sdk.resource.stbl import StringTable
+
+_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS strings USING fts5 (
+    val,
+    package UNINDEXED,
+    instance UNINDEXED,
+    key_hash UNINDEXED,
+    tokenize = 'trigram'
+);
+-- The rows of each package are given consecutive rowids, so that they
+-- can be deleted by rowid; the package column of strings can only be
+-- scanned
+CREATE TABLE IF NOT EXISTS string_rows (
+    package INTEGER PRIMARY KEY REFERENCES packages (id),
+    first INTEGER NOT NULL,
+    last INTEGER NOT NULL
+);
+"""
+
+
+class StringMatch(namedtuple("StringMatch", "package instance key_hash val")):
+    pass
+
+
+def _escape_like(query):
+    return (query.replace("\\", "\\\\").replace("%", "\\%")
+            .replace("_", "\\_"))
+
+
+class StringIndex(PackageCatalog):
+    """A trigram index over the strings of any number of packages, stored
+    in an SQLite database (using FTS5); see PackageCatalog for how
+    packages are added and kept up to date. Substring and prefix queries
+    of three or more characters are answered from the index; shorter
+    ones have to scan. Matching is case-insensitive.
+    """
+
+    SCHEMA = _SCHEMA
+
+    def _add(self, package_id, package):
+        first, = self.db.execute(
+            "SELECT COALESCE(MAX(last), 0) + 1 FROM string_rows").fetchone()
+        rowids = itertools.count(first)
+        for rid in stbl_ids(package):
+            columns = StringTable.read_bytes(package[rid].content).columns
+            if not len(columns):
+                continue
+            self.db.executemany(
+                "INSERT INTO strings (rowid, val, package, instance, "
+                "key_hash) VALUES (?, ?, ?, ?, ?)",
+                ((next(rowids), val, package_id, str(rid.instance), key_hash)
+                 for key_hash, val in zip(columns["key_hash"].tolist(),
+                                          columns["val"])))
+        last = next(rowids) - 1
+        if last >= first:
+            self.db.execute("INSERT INTO string_rows (package, first, last) "
+                            "VALUES (?, ?, ?)", (package_id, first, last))
+
+    def _delete(self, package_id):
+        row = self.db.execute("SELECT first, last FROM string_rows "
+                              "WHERE package = ?", (package_id,)).fetchone()
+        if row is not None:
+            self.db.execute("DELETE FROM strings WHERE rowid BETWEEN ? AND ?",
+                            row)
+            self.db.execute("DELETE FROM string_rows WHERE package = ?",
+                            (package_id,))
+
+    def search(self, query, prefix=False, limit=100):
+        """Find strings containing query (or, if prefix is true, starting
+        with it). Returns up to limit StringMatches."""
+        like = _escape_like(query) + "%"
+        if not prefix:
+            like = "%" + like
+        if len(query) >= 3:
+            # The phrase query is what hits the trigram index; LIKE with
+            # an ESCAPE clause can't, so it only filters the candidates
+            where = "strings MATCH ?"
+            params = ['"%s"' % (query.replace('"', '""'),)]
+            if prefix:
+                where += " AND val LIKE ? ESCAPE '\\'"
+                params.append(like)
+        else:
+            where = "val LIKE ? ESCAPE '\\'"
+            params = [like]
+        rows = self.db.execute(
+            "SELECT packages.name, strings.instance, strings.key_hash, "
+            "strings.val FROM strings JOIN packages "
+            "ON packages.id = strings.package WHERE " + where +
+            " LIMIT ?", params + [limit])
+        return [StringMatch(name, int(instance), key_hash, val)
+                for name, instance, key_hash, val in rows]
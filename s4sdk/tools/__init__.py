@@ -0,0 +1,14 @@
+import click
+
+from s4sdk import resource
+
+
+@click.group()
+@click.option("--idformat",
+              type=click.Choice(tuple(resource.ResourceID.FORMATTERS)),
+              default="maxis")
+def main(idformat):
+    resource.ResourceID.DEFAULT_FMT = idformat
+
+
+from s4sdk.tools import package  # noqa: E402,F401  (registers commands)
@@ -0,0 +1,264 @@
+import os.path
+
+import click
+
+from s4sdk import metadata, package
+from s4sdk.package.conflicts import find_conflicts
+from s4sdk.tools import main
+
+# Commands import anything that needs NumPy themselves, so that the CLI
+# starts quickly whichever command is run
+
+
+@main.group(name="package")
+def pkg():
+    pass
+
+
+@pkg.command(help="Report resources that are defined in more than one "
+                  "package. Packages are given in load order; the last "
+                  "one wins.")
+@click.option("--index-only", is_flag=True,
+              help="Never read content; payloads with equal sizes are "
+                   "reported as undecided")
+@click.option("--differing", is_flag=True,
+              help="Only report conflicts whose payloads differ")
+@click.argument("files", metavar="PKG...", nargs=-1, required=True,
+                type=click.Path(exists=True, readable=True))
+def conflicts(files, index_only, differing):
+    packages = [package.open_package(f, mode="r") for f in files]
+    names = {id(p): f for p, f in zip(packages, files)}
+    marks = {True: "differs", False: "same", None: "unknown"}
+    count = 0
+    for conflict in find_conflicts(packages, check_content=not index_only):
+        if differing and conflict.identical:
+            continue
+        count += 1
+        click.echo("{id} {size:>8d} {pkg}".format(
+            id=conflict.id, size=conflict.winner.size,
+            pkg=names[id(conflict.winner.package)]))
+        for rsrc, differs in zip(conflict.shadowed, conflict.differs):
+            click.echo("  {mark:<7s} {size:>8d} {pkg}".format(
+                mark=marks[differs], size=rsrc.size,
+                pkg=names[id(rsrc.package)]))
+    click.echo("%d conflicting resource(s)" % (count,), err=True)
+
+
+@pkg.command(help="Export every string table entry in a package to CSV")
+@click.option("--tsv", is_flag=True, help="Write tab-separated values")
+@click.option("--locale", type=click.Choice([l.name for l in metadata.Locale]),
+              help="Only export string tables of this locale")
+@click.option("--workers", "-j", type=int, default=None)
+@click.argument("file", metavar="PKG", type=click.Path(exists=True,
+                                                       readable=True))
+@click.argument("out", type=click.Path(writable=True))
+def strings(file, out, tsv, locale, workers):
+    from s4sdk import localization
+    dbfile = package.open_package(file, mode="r")
+    count = localization.write_strings(
+        dbfile, out, delimiter="\t" if tsv else ",",
+        locale=metadata.Locale[locale] if locale else None, workers=workers)
+    click.echo("%d string table(s) exported" % (count,), err=True)
+
+
+@pkg.command(help="Search the strings of packages, using (and updating) a "
+                  "persistent index. Packages that haven't changed since "
+                  "they were last indexed aren't read again.")
+@click.option("--index", "index_file", required=True,
+              type=click.Path(dir_okay=False, writable=True),
+              help="Index database, created if it doesn't exist")
+@click.option("--prefix", is_flag=True,
+              help="Match strings starting with QUERY, not containing it")
+@click.option("--limit", type=int, default=100, show_default=True)
+@click.argument("query")
+@click.argument("files", metavar="[PKG...]", nargs=-1,
+                type=click.Path(exists=True, readable=True))
+def search(index_file, query, files, prefix, limit):
+    from s4sdk.search import StringIndex
+    with StringIndex(index_file) as index:
+        updated = sum(index.update(f) for f in files)
+        if updated:
+            click.echo("%d package(s) indexed" % (updated,), err=True)
+        for match in index.search(query, prefix=prefix, limit=limit):
+            click.echo("{instance:016x} {key_hash:08x} {pkg}: {val}".format(
+                **match._asdict(), pkg=match.package))
+
+
+@pkg.command(name="check-simdata",
+             help="Check that every SimData resource in a package survives "
+                  "being written out again: each one is read, serialized "
+                  "and read back, and the objects compared.")
+@click.argument("file", metavar="PKG", type=click.Path(exists=True,
+                                                       readable=True))
+def check_simdata(file):
+    from s4sdk.resource import ResourceFilter
+    from s4sdk.resource.simdata import SimData, equivalent, write_simdata
+    dbfile = package.open_package(file, mode="r")
+    failed = 0
+    rids = list(dbfile.scan_index(
+        ResourceFilter(type=metadata.ResourceType.SIM_DATA.value)))
+    for rid in rids:
+        content = dbfile[rid].content
+        try:
+            original = SimData.read_bytes(content)
+            written = write_simdata(original.objects, original.version,
+                                    original._reader.schemas)
+            ok = equivalent(original.objects,
+                            SimData.read_bytes(written).objects)
+            message = "%d -> %d bytes" % (len(content), len(written))
+        except Exception as e:
+            ok, message = False, "%s: %s" % (type(e).__name__, e)
+        if not ok:
+            failed += 1
+            click.echo("%s FAILED %s" % (rid, message))
+    click.echo("%d SimData resource(s) checked, %d failed"
+               % (len(rids), failed), err=True)
+    if failed:
+        raise SystemExit(1)
+
+
+@pkg.command(name="dump-simdata",
+             help="Export every SimData resource in a package as JSON Lines: "
+                  "for each resource a header line, then a line per table "
+                  "row, all tagged with the resource ID.")
+@click.argument("file", metavar="PKG", type=click.Path(exists=True,
+                                                       readable=True))
+@click.argument("out", type=click.Path(writable=True))
+def dump_simdata(file, out):
+    from s4sdk.resource import ResourceFilter
+    from s4sdk.resource.simdata import write_json
+    dbfile = package.open_package(file, mode="r")
+    rids = list(dbfile.scan_index(
+        ResourceFilter(type=metadata.ResourceType.SIM_DATA.value)))
+    with open(out, "w", encoding="utf-8") as f:
+        for rid in rids:
+            write_json(dbfile[rid].content, f, lines=True,
+                       tag={"resource": str(rid)})
+    click.echo("%d SimData resource(s) exported" % (len(rids),), err=True)
+
+
+@pkg.command(name="list", help="List the resources in a package")
+@click.option("--names", "names_file",
+              type=click.Path(exists=True, dir_okay=False),
+              help="Name index (see 'package names') to show the names of "
+                   "instance IDs from")
+@click.argument("file", metavar="PKG", type=click.Path(exists=True,
+                                                       readable=True))
+def list_resources(file, names_file):
+    index = None
+    if names_file:
+        from s4sdk.names import NameIndex
+        index = NameIndex(names_file)
+    listing = package.Package.read(file).list(index)
+    rids = listing["resource_key"]
+    labels = listing["name"] if index is not None else [None] * len(rids)
+    for rid, name in zip(rids, labels):
+        click.echo(str(rid) if name is None else "%s %s" % (rid, name))
+
+
+@pkg.command(help="Add names to a name index, which lets hashes be shown "
+                  "as the names they were made from. Names come from text "
+                  "files, one per line, and from the tuning and SimData in "
+                  "packages. The index is created if it doesn't exist.")
+@click.option("--index", "index_file", required=True,
+              type=click.Path(dir_okay=False, writable=True))
+@click.option("--text", "text_files", multiple=True,
+              type=click.Path(exists=True, dir_okay=False),
+              help="File of names, one per line; may be repeated")
+@click.argument("files", metavar="[PKG...]", nargs=-1,
+                type=click.Path(exists=True, readable=True))
+def names(index_file, text_files, files):
+    import os.path
+    from s4sdk.names import NameIndex, package_names
+    known = []
+    if os.path.exists(index_file):
+        known.extend(NameIndex(index_file).names())
+    for text_file in text_files:
+        with open(text_file, "r", encoding="utf-8") as f:
+            known.extend(line.strip() for line in f)
+    for f in files:
+        known.extend(package_names(package.open_package(f, mode="r")))
+    index = NameIndex.build(index_file, known)
+    click.echo("%d name(s) in the index" % (len(index),), err=True)
+
+
+@pkg.command(help="Look up tuning by name, class, tuning type, module or "
+                  "instance ID, using (and updating) a persistent catalog. "
+                  "Packages that haven't changed since they were last "
+                  "indexed aren't read again.")
+@click.option("--index", "index_file", required=True,
+              type=click.Path(dir_okay=False, writable=True),
+              help="Catalog database, created if it doesn't exist")
+@click.option("--name")
+@click.option("--class", "cls")
+@click.option("--type", "tuning_type", help="Tuning type (the i attribute)")
+@click.option("--module")
+@click.option("--instance", type=lambda s: int(s, 0),
+              help="Instance ID; prefix with 0x for hex")
+@click.option("--limit", type=int, default=None)
+@click.option("--workers", "-j", type=int, default=None)
+@click.argument("files", metavar="[PKG...]", nargs=-1,
+                type=click.Path(exists=True, readable=True))
+def tuning(index_file, name, cls, tuning_type, module, instance, limit,
+           workers, files):
+    from s4sdk.tuning import TuningIndex
+    with TuningIndex(index_file) as index:
+        updated = sum(index.update(f, workers=workers) for f in files)
+        if updated:
+            click.echo("%d package(s) indexed" % (updated,), err=True)
+        for entry in index.find(name=name, cls=cls, tuning_type=tuning_type,
+                                module=module, instance=instance,
+                                limit=limit):
+            header = entry.header
+            click.echo("{id} {name} {cls} {module} {pkg}".format(
+                id=entry.id, name=header.name, cls=header.cls,
+                module=header.module, pkg=entry.package))
+
+
+@pkg.command(help="Show what resources need, following the references in "
+                  "SimData and tuning transitively, or with --reverse what "
+                  "needs them. With --extract, they and everything they "
+                  "need are copied into a new package.")
+@click.option("--reverse", is_flag=True,
+              help="Show what needs the resources instead")
+@click.option("--extract", "out", type=click.Path(writable=True),
+              help="Package to copy the resources and what they need into")
+@click.option("--workers", "-j", type=int, default=None)
+@click.argument("file", metavar="PKG", type=click.Path(exists=True,
+                                                       readable=True))
+@click.argument("rids", metavar="RID...", nargs=-1, required=True)
+def deps(file, rids, reverse, out, workers):
+    from s4sdk.package.sqlitepackage import SqlitePackage
+    from s4sdk.references import ReferenceGraph
+    from s4sdk.resource import ResourceID
+    try:
+        rids = [ResourceID.from_string(rid) for rid in rids]
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="RID")
+    # Checked before the (slow) graph is built; these are the formats
+    # open_package can write
+    if out and not (out.endswith((".package",) + SqlitePackage.EXTENSIONS)
+                    or out.endswith("/") or os.path.isdir(out)):
+        raise click.BadParameter(
+            "Can't write a package to %s; use .package, %s or a directory"
+            % (out, ", ".join(SqlitePackage.EXTENSIONS)),
+            param_hint="--extract")
+    dbfile = package.open_package(file, mode="r")
+    graph = ReferenceGraph.build(dbfile, workers=workers)
+    for error in graph.errors:
+        click.echo("warning: %s" % (error,), err=True)
+    try:
+        found = graph.dependents(rids) if reverse else graph.closure(rids)
+    except KeyError as e:
+        raise click.BadParameter(e.args[0], param_hint="RID")
+    missing = set() if reverse else set(graph.missing(rids))
+    for rid in found:
+        click.echo("%s missing" % (rid,) if rid in missing else str(rid))
+    if out:
+        dest = package.open_package(out, "w")
+        try:
+            missing = graph.extract(dbfile, rids, dest)
+        finally:
+            dest.close()
+        click.echo("%d resource(s) extracted, %d missing"
+                   % (len(found) - len(missing), len(missing)), err=True)
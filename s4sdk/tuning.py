@@ -0,0 +1,137 @@
+# A persistent catalog of the tuning in packages
+
+import io
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from s4sdk import metadata, utils
+from s4sdk.catalog import PackageCatalog
+from s4sdk.resource import ResourceID
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tuning (
+    package INTEGER NOT NULL REFERENCES packages (id),
+    type INTEGER NOT NULL,
+    grp INTEGER NOT NULL,
+    instance INTEGER NOT NULL,
+    root TEXT,
+    name TEXT,
+    class TEXT,
+    tuning_type TEXT,
+    module TEXT,
+    tuning_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS tuning_package ON tuning (package);
+CREATE INDEX IF NOT EXISTS tuning_instance ON tuning (instance);
+CREATE INDEX IF NOT EXISTS tuning_name ON tuning (name);
+CREATE INDEX IF NOT EXISTS tuning_class ON tuning (class);
+"""
+
+
+class TuningHeader(namedtuple("TuningHeader",
+                              "root name cls tuning_type module tuning_id")):
+    """The attributes of the root element of a tuning file: n, c, i, m
+    and s, which are its name, class, tuning type, module and instance
+    ID. root is the element's tag: I for instance tuning, M for module
+    tuning. Missing attributes are None."""
+    __slots__ = ()
+
+
+class TuningEntry(namedtuple("TuningEntry", "package id header")):
+    pass
+
+
+def read_tuning_header(content):
+    """Parse the root element of a tuning file, without reading any
+    further. Returns a TuningHeader, or None if content isn't XML."""
+    try:
+        for _, elem in ET.iterparse(io.BytesIO(content), events=("start",)):
+            attrib = elem.attrib
+            break
+        else:
+            return None
+    except ET.ParseError:
+        return None
+    tuning_id = attrib.get("s")
+    try:
+        tuning_id = int(tuning_id) if tuning_id is not None else None
+    except ValueError:
+        tuning_id = None
+    return TuningHeader(elem.tag, attrib.get("n"), attrib.get("c"),
+                        attrib.get("i"), attrib.get("m"), tuning_id)
+
+
+class TuningIndex(PackageCatalog):
+    """A catalog of the tuning files in any number of packages, by name,
+    class, tuning type, module and instance ID; see PackageCatalog for
+    how packages are added and kept up to date. Only the root element of
+    each tuning file is parsed, and files are read and parsed by a pool
+    of worker threads.
+    """
+
+    TYPES = (metadata.ResourceType.OBJ_TUNING.value,)
+    SCHEMA = _SCHEMA
+
+    def update(self, source, name=None, force=False, workers=None):
+        """Index the tuning of source; see PackageCatalog.update"""
+        return super().update(source, name, force, workers=workers)
+
+    def _add(self, package_id, package, workers=None):
+        rids = [rid for rid in package.scan_index() if rid.type in self.TYPES]
+
+        def header(rid):
+            return read_tuning_header(package[rid].content)
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            headers = list(pool.map(header, rids))
+        self.db.executemany(
+            "INSERT INTO tuning (package, type, grp, instance, root, name, "
+            "class, tuning_type, module, tuning_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((package_id, rid.type, rid.group, utils.u64_to_sql(rid.instance),
+              h.root, h.name, h.cls, h.tuning_type, h.module,
+              None if h.tuning_id is None
+              else utils.u64_to_sql(h.tuning_id & 0xFFFFFFFFFFFFFFFF))
+             for rid, h in zip(rids, headers) if h is not None))
+
+    def _delete(self, package_id):
+        self.db.execute("DELETE FROM tuning WHERE package = ?", (package_id,))
+
+    def find(self, name=None, cls=None, tuning_type=None, module=None,
+             instance=None, limit=None):
+        """Find tuning by any combination of name, class, tuning type,
+        module and instance ID, all matched exactly. Returns a list of
+        TuningEntries, in the order the packages were indexed."""
+        where, params = [], []
+        for column, value in (("tuning.name", name), ("class", cls),
+                              ("tuning_type", tuning_type),
+                              ("module", module)):
+            if value is not None:
+                where.append(column + " = ?")
+                params.append(value)
+        if instance is not None:
+            where.append("instance = ?")
+            params.append(utils.u64_to_sql(instance))
+        query = ("SELECT packages.name, type, grp, instance, root, "
+                 "tuning.name, class, tuning_type, module, tuning_id "
+                 "FROM tuning JOIN packages ON packages.id = tuning.package")
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY tuning.package, tuning.rowid"
+        if limit is not None:
+            query += " LIMIT %d" % (limit,)
+        return [TuningEntry(
+                    package, ResourceID(group, utils.u64_from_sql(instance),
+                                         type),
+                    TuningHeader(root, tname, tcls, ttype, tmodule,
+                                 None if tid is None
+                                 else utils.u64_from_sql(tid)))
+                for (package, type, group, instance, root, tname, tcls,
+                     ttype, tmodule, tid) in self.db.execute(query, params)]
+
+    def classes(self):
+        """Number of tuning files of each class"""
+        return dict(self.db.execute(
+            "SELECT class, COUNT(*) FROM tuning GROUP BY class "
+            "ORDER BY class"))
@@ -1,12 +1,22 @@
 import weakref
 import io
 import contextlib
+import importlib
+import os
+import secrets
+import struct
 
 
 class FormatException(Exception):
     pass
 
 
+# What parsing malformed input can raise, besides FormatException: for
+# callers that go through many resources and mustn't stop at a bad one
+PARSE_ERRORS = (FormatException, ValueError, KeyError, UnicodeDecodeError,
+                struct.error)
+
+
 class WeakIdDict(dict):
     # This is completely untested
     def __init__(self):
@@ -62,6 +72,99 @@ class LazyProperty:
             pass
 
 
+def require(module, extra):
+    """Import an optional dependency, which is only needed by some
+    features, explaining which extra provides it if it's missing"""
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise ImportError("This feature requires %s; install s4sdk with the "
+                          "'%s' extra" % (module.split(".")[0], extra)) \
+            from None
+
+
+def file_signature(name):
+    """Something that changes whenever the file at path name does, or
+    None if name isn't a path"""
+    try:
+        st = os.stat(name)
+    except (OSError, ValueError):
+        return None
+    return "%d:%d" % (st.st_mtime_ns, st.st_size)
+
+
+def temp_file(dir, prefix="", suffix=".tmp"):
+    """Create a new, empty file in dir for writing and then renaming
+    into place. Returns an open file descriptor and the file's name.
+    Unlike tempfile.mkstemp, which makes files only their owner can
+    read, the file gets the permissions of any new file: 0666 less the
+    umask."""
+    flags = os.O_RDWR | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    for _ in range(100):
+        name = os.path.join(dir, prefix + secrets.token_hex(8) + suffix)
+        try:
+            return os.open(name, flags, 0o666), name
+        except FileExistsError:
+            continue
+    raise FileExistsError("No unused temporary name in %s" % (dir,))
+
+
+def u64_to_sql(value):
+    # SQLite integers are signed 64-bit; store unsigned 64-bit values
+    # (such as instance IDs) two's-complement
+    return value - (1 << 64) if value & (1 << 63) else value
+
+
+def u64_from_sql(value):
+    return value & 0xFFFFFFFFFFFFFFFF
+
+
+class Columns:
+    """A minimal column store: named columns of equal length, each a NumPy
+    array or a list. This is what pandas-free code paths return instead
+    of a DataFrame; like a DataFrame, indexing by name gives a column,
+    iterating gives the column names and len() counts the rows.
+    to_pandas() converts to a DataFrame for those that want one."""
+
+    def __init__(self, columns):
+        self._columns = dict(columns)
+        lengths = {len(column) for column in self._columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("Columns differ in length")
+        self._len = lengths.pop() if lengths else 0
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    @property
+    def empty(self):
+        return self._len == 0
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return self._len
+
+    def __repr__(self):
+        return "<Columns: %d rows of %s>" % (self._len,
+                                             ", ".join(self._columns))
+
+    def rows(self):
+        """Iterate over the rows as tuples"""
+        return zip(*self._columns.values())
+
+    def to_pandas(self):
+        return require("pandas", "pandas").DataFrame(self._columns)
+
+
 class Thunk:
     """A lazily-evaluated value"""
     def __init__(self, thunk):